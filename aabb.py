@@ -1,59 +1,107 @@
 import pygame
-from typing import List
+import numpy as np
+from typing import Dict, List
 import sys
+import math
+import heapq
+import time
 from pygame.math import Vector2
 from pygame.rect import Rect
 from collections import deque
 
+from aabb_build import FlatTree, NULL_NODE, boxes_from_rects, build_sah, empty_flat_tree, levels, node_heights, read_flat_file, save_flat_file
+
 global_screen = None
 
 class AABB(object):
-    _lower_bound: Vector2
-    _upper_bound: Vector2
+    '''box as four floats. __slots__ keeps it small, and union_into / area_of_union let the
+    insertion and refit paths reuse boxes instead of allocating new ones'''
+    __slots__ = ("_min_x", "_min_y", "_max_x", "_max_y", "_cost")
+    _min_x: float
+    _min_y: float
+    _max_x: float
+    _max_y: float
+    _cost: float
     
-    def __init__(self, lower: Vector2, upper: Vector2):
-        self._lower_bound = lower
-        self._upper_bound = upper
-        width = self._upper_bound.x - self._lower_bound.x
-        height = self._upper_bound.y - self._lower_bound.y
-        self._cost = width * height #2 * width + 2 * height
+    def __init__(self, min_x: float = 0, min_y: float = 0, max_x: float = 0, max_y: float = 0):
+        self.set(min_x, min_y, max_x, max_y)
+
+    @staticmethod
+    def from_rect(rect: Rect) -> 'AABB':
+        return AABB(rect.left, rect.top, rect.right, rect.bottom)
+
+    def set(self, min_x: float, min_y: float, max_x: float, max_y: float):
+        self._min_x = min_x
+        self._min_y = min_y
+        self._max_x = max_x
+        self._max_y = max_y
+        self._cost = (max_x - min_x) * (max_y - min_y) #2 * width + 2 * height
         
+    @staticmethod
     def union(a1: 'AABB', a2: 'AABB', padding: int = 0) -> 'AABB':
         #padding: int = 10 # seems to do worse with less padding or more padding -- 25 is just right?
-        # if vel:
-        #     lower = Vector2(0, 0)
-        #     upper = Vector2(0, 0)
-        #     if vel.x > 0:
-        #         lower.x = min(a1._lower_bound.x, a2._lower_bound.x) - vel.x
-        #     else:
-        #         upper.x = max(a1._upper_bound.x, a2._upper_bound.x) + vel.x
-            
-        #     if vel.y > 0:
-        #         lower.y = min(a1._lower_bound.y, a2._lower_bound.y) - vel.y
-        #     else:
-        #         upper.y = max(a1._upper_bound.y, a2._upper_bound.y) + vel.y
-        # else:
-        lower = Vector2(0, 0)
-        upper = Vector2(0, 0)
-        lower.x = min(a1._lower_bound.x, a2._lower_bound.x) - padding
-        lower.y = min(a1._lower_bound.y, a2._lower_bound.y) - padding
-        upper.x = max(a1._upper_bound.x, a2._upper_bound.x) + padding
-        upper.y = max(a1._upper_bound.y, a2._upper_bound.y) + padding
-
-        return AABB(lower, upper)
+        return AABB.union_into(AABB(), a1, a2, padding)
+
+    @staticmethod
+    def union_into(out: 'AABB', a1: 'AABB', a2: 'AABB', padding: int = 0) -> 'AABB':
+        '''writes the union of a1 and a2 into out (which may be one of them) and returns it'''
+        out.set(min(a1._min_x, a2._min_x) - padding, min(a1._min_y, a2._min_y) - padding,
+                max(a1._max_x, a2._max_x) + padding, max(a1._max_y, a2._max_y) + padding)
+        return out
+
+    @staticmethod
+    def area_of_union(a1: 'AABB', a2: 'AABB') -> float:
+        '''AABB.union(a1, a2)._cost without building the box'''
+        return ((max(a1._max_x, a2._max_x) - min(a1._min_x, a2._min_x))
+                * (max(a1._max_y, a2._max_y) - min(a1._min_y, a2._min_y)))
+
+    @staticmethod
+    def overlap_volume_of_union(a1: 'AABB', a2: 'AABB', b: 'AABB') -> float:
+        '''AABB.union(a1, a2).overlap_volume(b) without building the box'''
+        overlap_x = min(max(a1._max_x, a2._max_x), b._max_x) - max(min(a1._min_x, a2._min_x), b._min_x)
+        if overlap_x <= 0:
+            return 0
+        overlap_y = min(max(a1._max_y, a2._max_y), b._max_y) - max(min(a1._min_y, a2._min_y), b._min_y)
+        if overlap_y <= 0:
+            return 0
+        return overlap_x * overlap_y
+
+    def fattened(self, margin: float, displacement: Vector2 = None) -> 'AABB':
+        '''copy of this box grown by margin on every side and stretched along displacement'''
+        min_x, min_y = self._min_x - margin, self._min_y - margin
+        max_x, max_y = self._max_x + margin, self._max_y + margin
+        if displacement is not None:
+            if displacement.x < 0:
+                min_x += displacement.x
+            else:
+                max_x += displacement.x
+            if displacement.y < 0:
+                min_y += displacement.y
+            else:
+                max_y += displacement.y
+
+        return AABB(min_x, min_y, max_x, max_y)
+
+    def overlaps(self, aabb: 'AABB') -> bool:
+        return not (self._max_x < aabb._min_x or self._min_x > aabb._max_x
+                    or self._max_y < aabb._min_y or self._min_y > aabb._max_y)
+
+    def contains(self, aabb: 'AABB') -> bool:
+        return (self._min_x <= aabb._min_x and self._min_y <= aabb._min_y
+                and aabb._max_x <= self._max_x and aabb._max_y <= self._max_y)
     
     def render(self, surface, color: str):
-        rect: Rect = Rect(self._lower_bound.x, self._lower_bound.y,
-                          self._upper_bound.x - self._lower_bound.x,
-                          self._upper_bound.y - self._lower_bound.y)
+        rect: Rect = Rect(self._min_x, self._min_y,
+                          self._max_x - self._min_x,
+                          self._max_y - self._min_y)
         pygame.draw.rect(surface, color, rect, 1)
 
     # inspiration from https://github.com/kip-hart/AABBTree/blob/master/aabbtree.py#L215
     def overlap_volume(self, aabb):
         volume = 1
 
-        min1, max1 = self._lower_bound.x, self._upper_bound.x
-        min2, max2 = aabb._lower_bound.x, aabb._upper_bound.x
+        min1, max1 = self._min_x, self._max_x
+        min2, max2 = aabb._min_x, aabb._max_x
 
         overlap_min = max(min1, min2)
         overlap_max = min(max1, max2)
@@ -62,8 +110,8 @@ class AABB(object):
 
         volume *= overlap_max - overlap_min
 
-        min1, max1 = self._lower_bound.y, self._upper_bound.y
-        min2, max2 = aabb._lower_bound.y, aabb._upper_bound.y
+        min1, max1 = self._min_y, self._max_y
+        min2, max2 = aabb._min_y, aabb._max_y
 
         overlap_min = max(min1, min2)
         overlap_max = min(max1, max2)
@@ -82,12 +130,16 @@ class AABBNode(object):
     _parent: 'AABBNode'
     _indx: int
     _cost: int
+    _height: int
+    _overlap: float
+    _leaf_count: int
+    _depth_sum: int
     
     def __init__(self, is_leaf: bool, indx: int, rect: Rect = None, aabb: AABB = None):
         self._is_leaf = is_leaf
         self._indx = indx
-        if is_leaf:
-            self._bounding_box = AABB(Vector2(rect.topleft), Vector2(rect.bottomright))
+        if is_leaf and rect is not None:
+            self._bounding_box = AABB.from_rect(rect)
         elif aabb != None:
             self._bounding_box = aabb
         else:
@@ -96,10 +148,16 @@ class AABBNode(object):
         self._right_child = None
         self._parent = None
         self._cost = 0
+        self._height = 0
+        # subtree totals kept next to _cost: overlap between siblings, leaves, sum of leaf depths
+        self._overlap = 0
+        self._leaf_count = 1 if is_leaf else 0
+        self._depth_sum = 0
         
     def cost(self):
-        '''recursive helper for cost function'''
-        self._cost = self.cost_recursive(self)
+        '''subtree cost, cached in _cost for internal nodes and kept up to date by AABBTree.refit_node'''
+        if self._is_leaf:
+            return self._bounding_box._cost
         return self._cost
 
     def cost_recursive(self, curr_node: 'AABBNode'):
@@ -114,8 +172,7 @@ class AABBNode(object):
     
     def find_best_cost(self, curr_node: 'AABBNode', new_node: 'AABBNode', curr_cost: int):
         '''recursive cost function based on bounding box costs'''
-        new_aabb = AABB.union(curr_node._bounding_box, new_node._bounding_box)
-        new_cost = new_aabb._cost # the cost to put the box around all 3 of them is always the same
+        new_cost = AABB.area_of_union(curr_node._bounding_box, new_node._bounding_box) # the cost to put the box around all 3 of them is always the same
         # base case
         if curr_node._is_leaf:
             return (curr_node, new_cost)
@@ -137,18 +194,18 @@ class AABBNode(object):
         curr_node = self
         curr_aabb = AABB.union(curr_node._bounding_box, new_node._bounding_box)
         cost = curr_aabb._cost
-        recursive_cost = self._cost
+        recursive_cost = self.cost()
 
         while curr_node._parent:
             # consider the cost of replacing the sibling with the new node
             if curr_node._parent._left_child == curr_node:
-                curr_aabb = AABB.union(curr_aabb, curr_node._parent._right_child._bounding_box)
+                AABB.union_into(curr_aabb, curr_aabb, curr_node._parent._right_child._bounding_box)
             else:
-                curr_aabb = AABB.union(curr_aabb, curr_node._parent._left_child._bounding_box)
+                AABB.union_into(curr_aabb, curr_aabb, curr_node._parent._left_child._bounding_box)
             cost += curr_aabb._cost
             curr_node = curr_node._parent
 
-        #global_screen.blit(cost_font.render(str(int(cost)), 1, pygame.Color("coral")), (self._bounding_box._lower_bound.x + 5, self._bounding_box._lower_bound.y + 5))
+        #global_screen.blit(cost_font.render(str(int(cost)), 1, pygame.Color("coral")), (self._bounding_box._min_x + 5, self._bounding_box._min_y + 5))
 
         return cost + recursive_cost
         
@@ -158,24 +215,69 @@ class AABBNode(object):
         
         if self._is_leaf:
             self._bounding_box.render(surface, pygame.Color(0, 255, 0))
-            #surface.blit(cost_font.render(str(int(self._indx)), 1, pygame.Color("coral")), (self._bounding_box._lower_bound.x, self._bounding_box._lower_bound.y))
+            #surface.blit(cost_font.render(str(int(self._indx)), 1, pygame.Color("coral")), (self._bounding_box._min_x, self._bounding_box._min_y))
         else:
             self._bounding_box.render(surface, color)
-            #surface.blit(cost_font.render(str(int(self.cost())), 1, pygame.Color("coral")), (self._bounding_box._lower_bound.x + 5, self._bounding_box._lower_bound.y + 5))
+            #surface.blit(cost_font.render(str(int(self.cost())), 1, pygame.Color("coral")), (self._bounding_box._min_x + 5, self._bounding_box._min_y + 5))
     
 class AABBTree(object):
     _nodes: List[AABBNode]
     _root: AABBNode
+    _margin: float
+    _displacement_multiplier: float
+    _proxies: Dict[int, AABBNode]
     
-    def __init__(self):
+    def __init__(self, margin: float = 10, displacement_multiplier: float = 4):
         self._nodes = []
         self._root = None
+        # handle -> leaf for everything added through create_proxy
+        self._proxies = {}
+        self._next_proxy = 0
+        # leaf boxes are fattened by margin plus displacement_multiplier * the predicted move
+        self._margin = margin
+        self._displacement_multiplier = displacement_multiplier
+        # nodes (or node pairs) tested by the last query / query_all_pairs
+        self._num_checks = 0
+        # where optimize's next scan window starts, nodes scanned since a batch last helped, and
+        # the SAH cost at which a whole lap stopped helping
+        self._optimize_cursor = 0
+        self._optimize_idle = 0
+        self._converged_cost = None
+        # query kind -> histogram of nodes visited per query, see stats
+        self._visits = {}
+
+    def insert_from_root(self, new_node: AABBNode, spare: AABBNode = None):
+        '''spare is an internal node unlink_node took out of this tree. it becomes new_node's
+        new parent instead of allocating one, and both are taken to still be in _nodes'''
+        self.insert_node_recursive(self._root, new_node, spare)
+
+    def pair_with(self, curr_node: AABBNode, new_node: AABBNode, spare: AABBNode = None) -> AABBNode:
+        '''puts a new internal node (or spare) where curr_node was, with curr_node and new_node
+        as its children, and returns it. its box is left for the caller to fit'''
+        internal_node = spare if spare is not None else AABBNode(False, -1)
+        parent = curr_node._parent
+        internal_node._parent = parent
+        # this is not the root node
+        if parent is not None:
+            if parent._left_child == curr_node:
+                parent._left_child = internal_node
+            else:
+                parent._right_child = internal_node
+        else:
+            self._root = internal_node
 
-    def insert_from_root(self, new_node: AABBNode):
-        self.insert_node_recursive(self._root, new_node)
+        # set children correctly and append
+        internal_node._left_child = curr_node
+        internal_node._right_child = new_node
+        curr_node._parent = internal_node
+        new_node._parent = internal_node
+        if spare is None:
+            self._nodes.append(internal_node)
+            self._nodes.append(new_node)
+        return internal_node
 
     # inspiration from https://github.com/kip-hart/AABBTree/blob/master/aabbtree.py#L340
-    def insert_node_recursive(self, curr_node: AABBNode, new_node: AABBNode):
+    def insert_node_recursive(self, curr_node: AABBNode, new_node: AABBNode, spare: AABBNode = None):
         if self._root is None:
             self._root = new_node
             self._nodes.append(new_node)
@@ -183,46 +285,31 @@ class AABBTree(object):
         
         if curr_node._is_leaf:
             # base case
-            internal_node = AABBNode(False, -1)
-            parent = curr_node._parent
-            internal_node._parent = parent
-            # this is not the root node
-            if parent is not None:
-                if parent._left_child == curr_node:
-                    parent._left_child = internal_node
-                else:
-                    parent._right_child = internal_node
-            else:
-                self._root = internal_node
-
-            # set children correctly and append
-            internal_node._left_child = curr_node
-            internal_node._right_child = new_node
-            curr_node._parent = internal_node
-            new_node._parent = internal_node
-            self._nodes.append(internal_node)
-            self._nodes.append(new_node)
-
-            internal_node._bounding_box = AABB.union(internal_node._left_child._bounding_box, internal_node._right_child._bounding_box, 10)
+            internal_node = self.pair_with(curr_node, new_node, spare)
+            if internal_node._bounding_box is None:
+                internal_node._bounding_box = AABB()
+            AABB.union_into(internal_node._bounding_box, curr_node._bounding_box, new_node._bounding_box, 10)
+            self.refit_stats(internal_node)
         else:
+            # every term straight from the boxes' floats, nothing is allocated on the way down
             new_aabb = new_node._bounding_box
-            branch_merge = AABB.union(curr_node._bounding_box, new_aabb)
-            left_merge = AABB.union(curr_node._left_child._bounding_box, new_aabb)
-            right_merge = AABB.union(curr_node._right_child._bounding_box, new_aabb)
+            left_aabb = curr_node._left_child._bounding_box
+            right_aabb = curr_node._right_child._bounding_box
+            branch_merge_cost = AABB.area_of_union(curr_node._bounding_box, new_aabb)
 
             # Calculate the change in the sum of the bounding volumes
-            branch_cost = branch_merge._cost
+            branch_cost = branch_merge_cost
 
-            left_cost = branch_merge._cost - curr_node._bounding_box._cost
-            left_cost += left_merge._cost - curr_node._left_child._bounding_box._cost
+            left_cost = branch_merge_cost - curr_node._bounding_box._cost
+            left_cost += AABB.area_of_union(left_aabb, new_aabb) - left_aabb._cost
 
-            right_cost = branch_merge._cost - curr_node._bounding_box._cost
-            right_cost += right_merge._cost - curr_node._right_child._bounding_box._cost
+            right_cost = branch_merge_cost - curr_node._bounding_box._cost
+            right_cost += AABB.area_of_union(right_aabb, new_aabb) - right_aabb._cost
 
             # Calculate amount of overlap
             branch_olap_cost = curr_node._bounding_box.overlap_volume(new_aabb)
-            left_olap_cost = left_merge.overlap_volume(curr_node._right_child._bounding_box)
-            right_olap_cost = right_merge.overlap_volume(curr_node._left_child._bounding_box)
+            left_olap_cost = AABB.overlap_volume_of_union(left_aabb, new_aabb, right_aabb)
+            right_olap_cost = AABB.overlap_volume_of_union(right_aabb, new_aabb, left_aabb)
 
             # Calculate total cost
             branch_cost += branch_olap_cost
@@ -230,34 +317,20 @@ class AABBTree(object):
             right_cost += right_olap_cost
 
             if branch_cost < left_cost and branch_cost < right_cost:
-                internal_node = AABBNode(False, -1)
-                parent = curr_node._parent
-                internal_node._parent = parent
-                # this is not the root node
-                if parent is not None:
-                    if parent._left_child == curr_node:
-                        parent._left_child = internal_node
-                    else:
-                        parent._right_child = internal_node
-                else:
-                    self._root = internal_node
-
-                # set children correctly and append
-                internal_node._left_child = curr_node
-                internal_node._right_child = new_node
-                curr_node._parent = internal_node
-                new_node._parent = internal_node
-                self._nodes.append(internal_node)
-                self._nodes.append(new_node)
+                internal_node = self.pair_with(curr_node, new_node, spare)
 
-                internal_node._bounding_box = AABB.union(internal_node._left_child._bounding_box, internal_node._right_child._bounding_box, 0)
+                # curr_node is below internal_node now, so internal_node is the one to refit here
+                self.refit_node(internal_node)
+                self.rotate_node(internal_node)
+                return
             elif left_cost < right_cost:
-                self.insert_node_recursive(curr_node._left_child, new_node)
+                self.insert_node_recursive(curr_node._left_child, new_node, spare)
             else:
-                self.insert_node_recursive(curr_node._right_child, new_node)
+                self.insert_node_recursive(curr_node._right_child, new_node, spare)
 
             # walks back up the tree for us?
-            curr_node._bounding_box = AABB.union(curr_node._left_child._bounding_box, curr_node._right_child._bounding_box, 0)
+            self.refit_node(curr_node)
+            self.rotate_node(curr_node)
                     
     def insert_node(self, new_node: AABBNode):
         if self._root is None:
@@ -266,9 +339,16 @@ class AABBTree(object):
             return
     
         # otherwise, make a new internal node and put this on right
+        internal_node = AABBNode(False, -1)
+        self._nodes.append(internal_node)
+        self._nodes.append(new_node)
+        self.insert_subtree(new_node, internal_node)
+
+    def insert_subtree(self, new_node: AABBNode, internal_node: AABBNode):
+        '''pairs new_node, a leaf or a whole subtree, with its best sibling under internal_node.
+        neither node is added to _nodes, insert_node does that for fresh ones'''
         best_node: AABBNode = self.find_best_node(self._root, new_node) # self.find_best_node_itr(new_node) # self.find_best_node(self._root, new_node) # self.find_best_node_heuristic(self._root, new_node)
         # internal_node_bb = AABB.union(new_node._bounding_box, best_node._bounding_box)
-        internal_node = AABBNode(False, -1)
         old_node = best_node._parent
         internal_node._parent = old_node
         
@@ -286,24 +366,48 @@ class AABBTree(object):
         internal_node._right_child = new_node
         best_node._parent = internal_node
         new_node._parent = internal_node
-        self._nodes.append(internal_node)
-        self._nodes.append(new_node)
         # Help given by Andrew Mueller, The OG Man, and my loving husband. :)
         
         # walk back up the tree to refit all the AABBs
         curr_node = internal_node
         while(curr_node != None):
-            curr_node._bounding_box = AABB.union(curr_node._left_child._bounding_box, curr_node._right_child._bounding_box)
+            self.refit_node(curr_node)
+            self.rotate_node(curr_node)
             curr_node = curr_node._parent
         
+    # branch and bound from Bittner et al., "Fast Insertion-Based Optimization of Bounding Volume Hierarchies"
     def find_best_node(self, curr_node: AABBNode, new_node: AABBNode) -> AABBNode:
-        #print(curr_node._indx)
-        # if this is a leaf, return
-        if not curr_node._left_child and not curr_node._right_child:
-            return curr_node
-        
-        # go down the rabbit hole  
-        best_node, _ = curr_node.find_best_cost(curr_node, new_node, 0) 
+        '''sibling under curr_node that adds the least SAH cost when new_node is paired with it.
+        the cost of picking a node is the area of its union with the new box plus the growth
+        of all its ancestors (the inherited cost). nodes come off a priority queue ordered by
+        inherited cost, and a subtree is dropped once inherited cost + the new box's own area
+        (a lower bound for anything below it) can no longer beat the best so far.'''
+        new_aabb = new_node._bounding_box
+        new_area = new_aabb._cost
+        best_node = curr_node
+        best_cost = AABB.area_of_union(curr_node._bounding_box, new_aabb)
+
+        # (inherited cost, tie breaker, node)
+        heap = [(0, 0, curr_node)]
+        pushed = 1
+        while len(heap) > 0:
+            inherited_cost, _, node = heapq.heappop(heap)
+            if inherited_cost + new_area >= best_cost:
+                break
+
+            direct_cost = AABB.area_of_union(node._bounding_box, new_aabb)
+            cost = direct_cost + inherited_cost
+            if cost < best_cost:
+                best_node = node
+                best_cost = cost
+
+            if not node._is_leaf:
+                child_inherited_cost = inherited_cost + direct_cost - node._bounding_box._cost
+                if child_inherited_cost + new_area < best_cost:
+                    heapq.heappush(heap, (child_inherited_cost, pushed, node._left_child))
+                    heapq.heappush(heap, (child_inherited_cost, pushed + 1, node._right_child))
+                    pushed += 2
+
         return best_node
 
     def find_best_node_itr(self, new_node: AABBNode) -> AABBNode:        
@@ -311,9 +415,7 @@ class AABBTree(object):
         best_node = None
         best_cost = sys.maxsize
 
-        for node in self._nodes:
-           node.cost()
-        
+        # subtree costs are cached, no need to recompute them first
         for node in self._nodes:
             curr_cost = node.trickle_up_cost(new_node)
             if curr_cost < best_cost:
@@ -328,34 +430,329 @@ class AABBTree(object):
             return curr_node
         
         # estimate costs
-        left_cost = curr_node._left_child._bounding_box._cost + AABB.union(curr_node._left_child._bounding_box, new_node._bounding_box)._cost
-        right_cost = curr_node._right_child._bounding_box._cost + AABB.union(curr_node._right_child._bounding_box, new_node._bounding_box)._cost
-        curr_cost = curr_node._bounding_box._cost + AABB.union(curr_node._bounding_box, new_node._bounding_box)._cost
+        left_cost = curr_node._left_child._bounding_box._cost + AABB.area_of_union(curr_node._left_child._bounding_box, new_node._bounding_box)
+        right_cost = curr_node._right_child._bounding_box._cost + AABB.area_of_union(curr_node._right_child._bounding_box, new_node._bounding_box)
+        curr_cost = curr_node._bounding_box._cost + AABB.area_of_union(curr_node._bounding_box, new_node._bounding_box)
 
         if curr_cost < left_cost and curr_cost < right_cost:
             return curr_node
         else:
             return self.find_best_node_heuristic(curr_node._left_child, new_node) if left_cost < right_cost else self.find_best_node_heuristic(curr_node._right_child, new_node)
 
-    def update_tree(self, circles):
-        #circles.sort(key=lambda c: (c._pos.x, c._pos.y))
+    def update_tree(self, circles, builder=build_sah):
+        # bulk build instead of one insert_from_root per circle
+        new_tree = AABBTree(self._margin, self._displacement_multiplier)
+        new_tree.build_from_boxes(boxes_from_rects([circle.rect for circle in circles]), builder)
+        return new_tree
 
-        new_tree = AABBTree()
-        for i, circle in enumerate(circles):
-            new_node = AABBNode(is_leaf=True, indx=i, rect=circle.rect)
-            new_tree.insert_from_root(new_node)
+    def build_from_boxes(self, boxes, builder=build_sah):
+        '''replaces the contents of this tree with a bulk build over boxes, an (N, 4) array of
+        min x, min y, max x, max y. leaf i gets _indx i. builder is build_sah or build_lbvh.'''
+        self.load_flat(builder(boxes))
 
-        return new_tree
+    def load_flat(self, flat: FlatTree):
+        '''creates one AABBNode per node of an array form tree'''
+        self._nodes = []
+        self._root = None
+        self._proxies = {}
+        if flat.root == NULL_NODE:
+            return
+
+        heights = node_heights(flat).tolist()
+        bounds = flat.bounds.tolist()
+        child = flat.child.tolist()
+        indx = flat.indx.tolist()
+        nodes = {}
+        for level in levels(flat):
+            for i in level.tolist():
+                x0, y0, x1, y1 = bounds[i]
+                node = AABBNode(child[i][0] == NULL_NODE, indx[i], aabb=AABB(x0, y0, x1, y1))
+                node._height = heights[i]
+                nodes[i] = node
+                self._nodes.append(node)
+
+        for i, node in nodes.items():
+            if not node._is_leaf:
+                node._left_child = nodes[child[i][0]]
+                node._right_child = nodes[child[i][1]]
+                node._left_child._parent = node
+                node._right_child._parent = node
+
+        # children come after their parents in _nodes
+        for node in reversed(self._nodes):
+            if not node._is_leaf:
+                self.refit_stats(node)
+
+        self._root = nodes[flat.root]
+
+    def to_flat(self) -> FlatTree:
+        '''array form copy of the tree, root first'''
+        if self._root is None:
+            return empty_flat_tree()
+
+        order = [self._root]
+        for node in order:
+            if not node._is_leaf:
+                order.append(node._left_child)
+                order.append(node._right_child)
+        ids = {node: i for i, node in enumerate(order)}
+
+        bounds = np.array([(node._bounding_box._min_x, node._bounding_box._min_y,
+                            node._bounding_box._max_x, node._bounding_box._max_y) for node in order])
+        child = np.array([(NULL_NODE, NULL_NODE) if node._is_leaf else (ids[node._left_child], ids[node._right_child])
+                          for node in order], dtype=np.int32)
+        parent = np.array([ids[node._parent] if node._parent else NULL_NODE for node in order], dtype=np.int32)
+        indx = np.array([node._indx if node._is_leaf else -1 for node in order], dtype=np.int32)
+        return FlatTree(bounds, child, parent, indx, 0)
+
+    def save(self, path: str):
+        '''writes the tree as a flat binary snapshot, see aabb_build.save_flat_file'''
+        save_flat_file(self.to_flat(), path)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True, margin: float = 10, displacement_multiplier: float = 4):
+        '''reads a snapshot written by save. with mmap the file is memory mapped into an
+        AABBArrayTree, which answers the same queries without creating a node object per
+        node. without it the nodes are rebuilt into a regular AABBTree.'''
+        if mmap:
+            from aabb_array import AABBArrayTree  # aabb_array imports this module
+
+            return AABBArrayTree.load(path, True, margin, displacement_multiplier)
+
+        tree = AABBTree(margin, displacement_multiplier)
+        tree.load_flat(read_flat_file(path, mmap=False))
+        return tree
+
+    def sah_cost(self) -> float:
+        '''sum of the internal node areas, cached on the root'''
+        return self._root._cost if self._root else 0
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every leaf whose box overlaps aabb'''
+        self._num_checks = 0
+        if self._root is None:
+            return
+
+        stack = [self._root]
+        while len(stack) > 0:
+            top = stack.pop()
+            self._num_checks += 1
+            if not top._bounding_box.overlaps(aabb):
+                continue
+            if top._is_leaf:
+                yield top._indx
+            else:
+                stack.append(top._left_child)
+                stack.append(top._right_child)
+        self.record_visits("query", self._num_checks)
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) once for every pair of leaves whose boxes overlap, by descending
+        the tree against itself instead of running one query per leaf'''
+        self._num_checks = 0
+        if self._root is None:
+            return
+
+        stack = [(self._root, self._root)]
+        while len(stack) > 0:
+            node_a, node_b = stack.pop()
+            self._num_checks += 1
+            if node_a is node_b:
+                # pairs inside one subtree: each child with itself, then the children against each other
+                if not node_a._is_leaf:
+                    stack.append((node_a._left_child, node_a._left_child))
+                    stack.append((node_a._right_child, node_a._right_child))
+                    stack.append((node_a._left_child, node_a._right_child))
+            elif not node_a._bounding_box.overlaps(node_b._bounding_box):
+                continue
+            elif node_a._is_leaf and node_b._is_leaf:
+                yield (node_a._indx, node_b._indx)
+            elif node_b._is_leaf or (not node_a._is_leaf and node_a._bounding_box._cost >= node_b._bounding_box._cost):
+                # descend into the bigger box first
+                stack.append((node_a._left_child, node_b))
+                stack.append((node_a._right_child, node_b))
+            else:
+                stack.append((node_a, node_b._left_child))
+                stack.append((node_a, node_b._right_child))
+        self.record_visits("query_all_pairs", self._num_checks)
+
+    def query_tree(self, other):
+        '''yields (indx in self, indx in other) for every pair of overlapping leaves across two
+        trees, descending both at once the same way query_all_pairs does. other can also be an
+        AABBArrayTree, like the one AABBTree.load maps from a snapshot'''
+        if not isinstance(other, AABBTree):
+            yield from self.query_array_tree(other)
+            return
+
+        self._num_checks = 0
+        if self._root is None or other._root is None:
+            return
+
+        stack = [(self._root, other._root)]
+        while len(stack) > 0:
+            node_a, node_b = stack.pop()
+            self._num_checks += 1
+            if not node_a._bounding_box.overlaps(node_b._bounding_box):
+                continue
+            elif node_a._is_leaf and node_b._is_leaf:
+                yield (node_a._indx, node_b._indx)
+            elif node_b._is_leaf or (not node_a._is_leaf and node_a._bounding_box._cost >= node_b._bounding_box._cost):
+                stack.append((node_a._left_child, node_b))
+                stack.append((node_a._right_child, node_b))
+            else:
+                stack.append((node_a, node_b._left_child))
+                stack.append((node_a, node_b._right_child))
+        self.record_visits("query_tree", self._num_checks)
+
+    def query_array_tree(self, other):
+        '''query_tree against an AABBArrayTree: this side walks AABBNodes, the other side walks
+        slots of other's arrays'''
+        self._num_checks = 0
+        if self._root is None or other._root == NULL_NODE:
+            return
+
+        stack = [(self._root, other._root)]
+        while len(stack) > 0:
+            node_a, node_b = stack.pop()
+            self._num_checks += 1
+            box_a = node_a._bounding_box
+            bx0, by0, bx1, by1 = other._bounds[node_b].tolist()
+            if box_a._max_x < bx0 or box_a._min_x > bx1 or box_a._max_y < by0 or box_a._min_y > by1:
+                continue
+
+            left_b, right_b = other._child[node_b].tolist()
+            if node_a._is_leaf and left_b == NULL_NODE:
+                yield (node_a._indx, int(other._indx[node_b]))
+            elif left_b == NULL_NODE or (not node_a._is_leaf and box_a._cost >= (bx1 - bx0) * (by1 - by0)):
+                stack.append((node_a._left_child, node_b))
+                stack.append((node_a._right_child, node_b))
+            else:
+                stack.append((node_a, left_b))
+                stack.append((node_a, right_b))
+        self.record_visits("query_tree", self._num_checks)
+
+    def raycast(self, origin: Vector2, direction: Vector2, max_t: float, callback) -> float:
+        '''casts the segment origin + t * direction for 0 <= t <= max_t through the tree.
+        callback(indx, max_t) is called for every leaf box the segment enters, nearer child
+        first, and returns the new max_t: the hit's t to clip the segment, max_t to keep going
+        unchanged or 0 to stop. returns the final max_t'''
+        if self._root is None:
+            return max_t
+
+        ox, oy = origin.x, origin.y
+        dx, dy = direction.x, direction.y
+        t_enter = self.slab_entry(self._root._bounding_box, ox, oy, dx, dy, max_t)
+        if t_enter is None:
+            return max_t
+
+        stack = [(t_enter, self._root)]
+        while len(stack) > 0:
+            t_enter, top = stack.pop()
+            # max_t may have been clipped since this node was pushed
+            if t_enter > max_t:
+                continue
+
+            if top._is_leaf:
+                max_t = min(max_t, callback(top._indx, max_t))
+                if max_t <= 0:
+                    return 0
+                continue
+
+            t_left = self.slab_entry(top._left_child._bounding_box, ox, oy, dx, dy, max_t)
+            t_right = self.slab_entry(top._right_child._bounding_box, ox, oy, dx, dy, max_t)
+            # push the farther child first so the nearer one is visited first
+            if t_left is not None and t_right is not None and t_left < t_right:
+                stack.append((t_right, top._right_child))
+                stack.append((t_left, top._left_child))
+            else:
+                if t_left is not None:
+                    stack.append((t_left, top._left_child))
+                if t_right is not None:
+                    stack.append((t_right, top._right_child))
+
+        return max_t
+
+    def slab_entry(self, aabb: AABB, ox: float, oy: float, dx: float, dy: float, max_t: float):
+        '''t at which the segment enters aabb (0 if it starts inside), None if it misses'''
+        t_min = 0
+        t_max = max_t
+        for o, d, lower, upper in ((ox, dx, aabb._min_x, aabb._max_x),
+                                   (oy, dy, aabb._min_y, aabb._max_y)):
+            if d == 0:
+                # parallel to this slab, either always inside it or never
+                if o < lower or o > upper:
+                    return None
+                continue
+            t1 = (lower - o) / d
+            t2 = (upper - o) / d
+            if t1 > t2:
+                t1, t2 = t2, t1
+            t_min = max(t_min, t1)
+            t_max = min(t_max, t2)
+            if t_min > t_max:
+                return None
+        return t_min
+
+    def nearest(self, point: Vector2, circles, max_dist: float = math.inf):
+        '''lazily yields (distance, indx) for circles in order of increasing distance from point
+        to their edge (0 if point is inside), stopping past max_dist. best-first search: the
+        heap is keyed on point to box distance and leaves are re-pushed with their exact
+        circle distance, so take as many as needed, e.g. itertools.islice(..., k)'''
+        if self._root is None:
+            return
+
+        px, py = point.x, point.y
+        # (distance, tie breaker, node, distance is exact)
+        heap = [(self.point_box_distance(self._root._bounding_box, px, py), 0, self._root, False)]
+        pushed = 1
+        while len(heap) > 0:
+            dist, _, node, exact = heapq.heappop(heap)
+            if dist > max_dist:
+                return
+
+            if exact:
+                yield (dist, node._indx)
+            elif node._is_leaf:
+                exact_dist = circles[node._indx].distance_to_point(point)
+                heapq.heappush(heap, (exact_dist, pushed, node, True))
+                pushed += 1
+            else:
+                for child in (node._left_child, node._right_child):
+                    child_dist = self.point_box_distance(child._bounding_box, px, py)
+                    if child_dist <= max_dist:
+                        heapq.heappush(heap, (child_dist, pushed, child, False))
+                        pushed += 1
+
+    def query_radius(self, point: Vector2, radius: float, circles):
+        '''lazily yields (distance, indx) for every circle within radius of point, closest first'''
+        yield from self.nearest(point, circles, radius)
+
+    def point_box_distance(self, aabb: AABB, px: float, py: float) -> float:
+        dx = max(aabb._min_x - px, 0, px - aabb._max_x)
+        dy = max(aabb._min_y - py, 0, py - aabb._max_y)
+        return math.sqrt(dx * dx + dy * dy)
 
     def render_tree(self, screen, color):
         for node in self._nodes:
             # print(node)
-            # print(node._bounding_box._lower_bound, node._bounding_box._upper_bound)
+            # print(node._bounding_box._min_x, node._bounding_box._max_x)
             node.render(screen, color)
             color.g = (color.g + 30) % 255
 
     # Thanks ChatGPT :-)
     def delete_leaf_node(self, node: AABBNode):
+        parent = self.unlink_node(node)
+        if parent is not None:
+            # remove this overwritten internal parent node (I had to add this)
+            self._nodes.remove(parent)
+
+        # Remove the node from the list of nodes.
+        self._nodes.remove(node)
+
+    def unlink_node(self, node: AABBNode) -> AABBNode:
+        '''takes node (and whatever hangs below it) out of the tree, the sibling moves up into
+        the parent's place. returns the detached parent, None if node was the root'''
+        parent = None
         if node._parent is None:
             # Node is the root of the tree.
             self._root = None
@@ -380,23 +777,257 @@ class AABBTree(object):
                 # Walk back up the tree, updating bounding boxes.
                 curr_node = sibling._parent
                 while curr_node is not None:
-                    curr_node._bounding_box = AABB.union(curr_node._left_child._bounding_box, curr_node._right_child._bounding_box)
+                    self.refit_node(curr_node)
+                    self.rotate_node(curr_node)
                     curr_node = curr_node._parent
 
-            # remove this overwritten internal parent node (I had to add this)
-            self._nodes.remove(parent)
-                
-        # Remove the node from the list of nodes.
-        self._nodes.remove(node)
+        return parent
+
+    # incremental optimization from Bittner et al., "Fast Insertion-Based Optimization of Bounding Volume Hierarchies"
+    def optimize(self, budget_ms: float, batch_size: int = None, window: int = 256) -> int:
+        '''takes the internal nodes that waste the most area out of the tree and reinserts
+        their two children, reusing the node and its old parent as the new internal nodes.
+        candidates come from a window of _nodes that moves round robin, so a call never scans
+        the whole tree, and the budget is checked while scanning too. works in batches of the
+        worst nodes of each window until budget_ms runs out. once a whole lap of windows goes
+        by without a batch lowering the SAH cost, later calls do nothing until the tree
+        changes. returns the number of nodes reinserted'''
+        deadline = time.perf_counter() + budget_ms / 1000
+        if batch_size is None:
+            batch_size = max(1, window // 16)
+        if self._root is None or self.sah_cost() == self._converged_cost:
+            return 0
+
+        num_reinserted = 0
+        while time.perf_counter() < deadline:
+            candidates = []
+            num_nodes = len(self._nodes)
+            for step in range(min(window, num_nodes)):
+                if step % 32 == 31 and time.perf_counter() >= deadline:
+                    return num_reinserted
+                node = self._nodes[(self._optimize_cursor + step) % num_nodes]
+                if not node._is_leaf and node._parent is not None:
+                    candidates.append(node)
+            self._optimize_cursor = (self._optimize_cursor + window) % max(num_nodes, 1)
+            self._optimize_idle += min(window, num_nodes)
+
+            cost_before = self.sah_cost()
+            for node in heapq.nlargest(batch_size, candidates, key=self.inefficiency):
+                if time.perf_counter() >= deadline:
+                    break
+                if node._parent is None:
+                    # earlier reinsertions in this batch made it the root
+                    continue
+                self.reinsert_children(node)
+                num_reinserted += 1
+
+            if self.sah_cost() < cost_before:
+                self._optimize_idle = 0
+            elif self._optimize_idle >= num_nodes:
+                # remembered so later frames skip the scan until something moves
+                self._converged_cost = self.sah_cost()
+                self._optimize_idle = 0
+                break
+
+        return num_reinserted
+
+    def inefficiency(self, node: AABBNode) -> float:
+        '''Bittner's combined measure: big boxes whose children cover little of them score high'''
+        area = node._bounding_box._cost
+        left_area = node._left_child._bounding_box._cost
+        right_area = node._right_child._bounding_box._cost
+        return area * area * area / max(min(left_area, right_area) * (left_area + right_area) / 2, 1)
+
+    def reinsert_children(self, node: AABBNode):
+        parent = self.unlink_node(node)
+        left = node._left_child
+        right = node._right_child
+        left._parent = None
+        right._parent = None
+
+        # bigger subtree first, it has the most to gain from a good spot
+        if left._bounding_box._cost < right._bounding_box._cost:
+            left, right = right, left
+        self.insert_subtree(left, node)
+        self.insert_subtree(right, parent)
+
+    def fatten_aabb(self, aabb: AABB, displacement: Vector2 = None) -> AABB:
+        if displacement is not None:
+            displacement = displacement * self._displacement_multiplier
+        return aabb.fattened(self._margin, displacement)
+
+    def create_proxy(self, aabb: AABB, user_data: int) -> int:
+        '''adds a leaf with aabb fattened by margin and returns its handle. user_data is the
+        leaf's _indx, so it is what queries hand back'''
+        node = AABBNode(is_leaf=True, indx=user_data, aabb=self.fatten_aabb(aabb))
+        self.insert_node(node)
+        handle = self._next_proxy
+        self._next_proxy += 1
+        self._proxies[handle] = node
+        return handle
+
+    def destroy_proxy(self, handle: int):
+        self.delete_leaf_node(self._proxies.pop(handle))
+
+    def get_indx(self, handle: int) -> int:
+        return self._proxies[handle]._indx
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return self._proxies[handle]._bounding_box
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''moves a proxy to its new tight box. nothing happens while the tight box stays inside
+        the leaf's fat box, otherwise the leaf is refattened and reinserted and True is returned'''
+        node = self._proxies[handle]
+        if node._bounding_box.contains(new_aabb):
+            return False
+
+        self.reinsert_leaf(node, self.fatten_aabb(new_aabb, displacement))
+        return True
+
+    def reinsert_leaf(self, node: AABBNode, new_aabb: AABB):
+        '''gives a leaf a new box and moves it to its best spot, reusing the leaf and its old
+        parent so nothing is allocated and _nodes is left alone'''
+        node._bounding_box = new_aabb
+        parent = self.unlink_node(node)
+        node._parent = None
+        if parent is None:
+            # it was the whole tree
+            self._root = node
+            return
+        self.insert_subtree(node, parent)
 
     def update_node(self, node: AABBNode, new_aabb: AABB):
         node._bounding_box = new_aabb
         # walk back up the tree to refit all the AABBs
         curr_node = node._parent
         while curr_node is not None:
-            curr_node._bounding_box = AABB.union(curr_node._left_child._bounding_box, curr_node._right_child._bounding_box)
+            self.refit_node(curr_node)
+            self.rotate_node(curr_node)
             curr_node = curr_node._parent
 
+    def refit_node(self, node: AABBNode):
+        '''recompute an internal node's box, height and cached subtree cost from its children'''
+        if node._bounding_box is None:
+            node._bounding_box = AABB()
+        AABB.union_into(node._bounding_box, node._left_child._bounding_box, node._right_child._bounding_box)
+        self.refit_stats(node)
+
+    def refit_stats(self, node: AABBNode):
+        '''recompute the cached subtree numbers of an internal node whose box is already right'''
+        left = node._left_child
+        right = node._right_child
+        node._height = 1 + max(left._height, right._height)
+        node._cost = node._bounding_box._cost + left._cost + right._cost
+        node._overlap = left._bounding_box.overlap_volume(right._bounding_box) + left._overlap + right._overlap
+        node._leaf_count = left._leaf_count + right._leaf_count
+        # every leaf below node is one level deeper than it is below the children
+        node._depth_sum = left._depth_sum + right._depth_sum + node._leaf_count
+
+    # rotations based on Box2D v3's b2_dynamic_tree.c (b2RotateNodes)
+    def rotate_node(self, node_a: AABBNode):
+        '''swap a child of node_a with a grandchild on the other side if that shrinks the
+        internal child the grandchild moves out of. node_a's own box never changes.'''
+        if node_a._is_leaf or node_a._height < 2:
+            return
+
+        node_b = node_a._left_child
+        node_c = node_a._right_child
+        best_cost = 0
+        best_swap = None
+
+        if not node_c._is_leaf:
+            # B <-> F leaves C = {B, G}, B <-> G leaves C = {F, B}
+            area_c = node_c._bounding_box._cost
+            cost_bf = AABB.area_of_union(node_b._bounding_box, node_c._right_child._bounding_box) - area_c
+            cost_bg = AABB.area_of_union(node_b._bounding_box, node_c._left_child._bounding_box) - area_c
+            if cost_bf < best_cost:
+                best_cost, best_swap = cost_bf, (node_b, node_c._left_child)
+            if cost_bg < best_cost:
+                best_cost, best_swap = cost_bg, (node_b, node_c._right_child)
+
+        if not node_b._is_leaf:
+            # C <-> D leaves B = {C, E}, C <-> E leaves B = {D, C}
+            area_b = node_b._bounding_box._cost
+            cost_cd = AABB.area_of_union(node_c._bounding_box, node_b._right_child._bounding_box) - area_b
+            cost_ce = AABB.area_of_union(node_c._bounding_box, node_b._left_child._bounding_box) - area_b
+            if cost_cd < best_cost:
+                best_cost, best_swap = cost_cd, (node_c, node_b._left_child)
+            if cost_ce < best_cost:
+                best_cost, best_swap = cost_ce, (node_c, node_b._right_child)
+
+        if best_swap is not None:
+            self.swap_with_grandchild(node_a, best_swap[0], best_swap[1])
+
+    def swap_with_grandchild(self, node_a: AABBNode, child: AABBNode, grandchild: AABBNode):
+        other = grandchild._parent
+        if other._left_child == grandchild:
+            other._left_child = child
+        else:
+            other._right_child = child
+        child._parent = other
+
+        if node_a._left_child == child:
+            node_a._left_child = grandchild
+        else:
+            node_a._right_child = grandchild
+        grandchild._parent = node_a
+
+        self.refit_node(other)
+        self.refit_stats(node_a)
+
+    def height(self) -> int:
+        return self._root._height if self._root else 0
+
+    def stats(self) -> dict:
+        '''tree quality read off the totals cached on the root, cheap enough for every frame.
+        visits maps a query kind ("query", "query_all_pairs", "query_tree") to a histogram
+        where bucket b counts queries that visited 2^(b-1) to 2^b - 1 nodes'''
+        report = {"height": 0, "optimal_height": 0, "leaves": 0, "sah": 0, "sibling_overlap": 0,
+                  "avg_leaf_depth": 0.0, "visits": {kind: list(buckets) for kind, buckets in self._visits.items()}}
+        if self._root is None:
+            return report
+
+        leaves = self._root._leaf_count
+        report["height"] = self._root._height
+        report["optimal_height"] = math.ceil(math.log2(leaves)) if leaves > 1 else 0
+        report["leaves"] = leaves
+        report["sah"] = self._root._cost
+        report["sibling_overlap"] = self._root._overlap
+        report["avg_leaf_depth"] = self._root._depth_sum / leaves
+        return report
+
+    def record_visits(self, kind: str, visits: int):
+        buckets = self._visits.setdefault(kind, [])
+        bucket = visits.bit_length()
+        if bucket >= len(buckets):
+            buckets.extend([0] * (bucket + 1 - len(buckets)))
+        buckets[bucket] += 1
+
+    def reset_visits(self):
+        self._visits = {}
+
+    def balance_report(self) -> dict:
+        '''stats() plus the shallowest and deepest leaf, which take a walk over the tree'''
+        report = self.stats()
+        report["min_leaf_depth"] = 0
+        report["max_leaf_depth"] = 0
+        if self._root is None:
+            return report
+
+        depths = []
+        stack = [(self._root, 0)]
+        while len(stack) > 0:
+            node, depth = stack.pop()
+            if node._is_leaf:
+                depths.append(depth)
+            else:
+                stack.append((node._left_child, depth + 1))
+                stack.append((node._right_child, depth + 1))
+        report["min_leaf_depth"] = min(depths)
+        report["max_leaf_depth"] = max(depths)
+        return report
+
     # Thanks ChatGPT :-)
     # format printed for use with https://www.leetcode-tree-visualizer.com/
     def print_levels(self):
@@ -426,229 +1057,7 @@ class AABBTree(object):
         print(','.join(output))
         
 if __name__ == "__main__":
-    import os
-    from typing import List
-    import random
-    import itertools
-    import argparse
-
-    from circle import Circle
-    from wall import Wall
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument("num_spawn", help="num circles to spawn on map", type=int)
-    parser.add_argument("min_radius", help="minimum radius of circles", type=int)
-    parser.add_argument("max_radius", help="maximum radius of circles", type=int)
-    parser.add_argument("spacing", help="spacing of circles", type=int)
-    args = parser.parse_args()
-    num_spawn = int(args.num_spawn)
-    min_radius = int(args.min_radius)
-    max_radius = int(args.max_radius)
-    spacing = int(args.spacing)
-
-    SCREEN_WIDTH = 1280
-    SCREEN_HEIGHT = 720
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT)) # flags=pygame.NOFRAME
-    pygame.display.set_caption('AABB Tree Debug')
-    global_screen = screen
-    clock = pygame.time.Clock()
-    running = True
-    paused = False
-
-    # fps counter
-    font = pygame.font.SysFont("dejavusansmono", 18)
-    def update_fps():
-        fps = str(int(clock.get_fps())) # averages the last 10 calls to Clock.tick()
-        fps_text = font.render(fps, 1, pygame.Color("coral"))
-        return fps_text
-    
-    def render_text(text: str):
-        return font.render(text, 1, pygame.Color("coral"))
-
-    cost_font = pygame.font.SysFont("dejavusansmono", 12)
-
-    # circle spawning
-    # calculate number that we can spawn with the radius + spacing
-    num_width = int(SCREEN_WIDTH / (max_radius * 2 + spacing))
-    num_height = int(SCREEN_HEIGHT / (max_radius * 2 + spacing))
-    if(num_spawn > num_width * num_height):
-        print("too many circles, not enough room!")
-        exit()
-
-    # spawn circles
-    circles: List[Circle] = []
-    curr_x = spacing
-    curr_y = spacing
-    aabb_tree = AABBTree()
-    for i in range(num_height):
-        curr_y += max_radius
-
-        for j in range(num_width):
-            if i * num_width + j >= num_spawn:
-                break
-
-            curr_x += max_radius
-            curr_circle = Circle((curr_x, curr_y),
-                                (random.randint(-100, 100), random.randint(-100, 100)),
-                                (0, 0),# (random.randint(-20, 20), random.randint(-20, 20)),
-                                random.randint(min_radius, max_radius),  # can experiment with random radius -- random.randint(1, radius)
-                                random.choice(["green", "blue", "yellow", "red", "grey"]))
-            new_node = AABBNode(is_leaf=True, indx=len(circles), rect=curr_circle.rect)
-            circles.append(curr_circle)
-            aabb_tree.insert_from_root(new_node)
-            curr_x += max_radius + spacing
-
-        # reset pos
-        curr_x = spacing
-        curr_y += max_radius + spacing
-        
-    total_time = 0
-    num_checks = 0
-    total_frames = 0
-    frames_checks = 0
-    reinsertions = 0
-    avg_frames_render = None
-    avg_checks_render = None
-    avg_reinserts_render = None
-
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_q:
-                    running = False
-                if event.key == pygame.K_p:
-                    paused = not paused
-
-        # convert dt to seconds by dividing by 1000
-        dt = clock.tick() / 1000
-                
-        screen.fill("#000000")
-        
-        if paused:
-            continue
-
-        for circle in circles:
-            circle.on_tick(dt)
-
-        nodes_to_redraw = []
-        for node in aabb_tree._nodes:
-            if node._is_leaf and node._parent:
-                circle = circles[node._indx]
-                rect1 = circle.rect
-
-                # redraw node if any part of the circle has left its immediate parent's bounding box
-                rect2 = node._parent._bounding_box
-                not_overlapping = rect1.x + rect1.w - 2*circle._radius < rect2._lower_bound.x or rect1.x + 2*circle._radius > rect2._upper_bound.x or rect1.y + rect1.h - 2*circle._radius < rect2._lower_bound.y or rect1.y + 2*circle._radius > rect2._upper_bound.y
-                #overlapping = not (rect1.x + rect1.w - circle._vel.x < rect2._lower_bound.x or rect1.x + circle._vel.x > rect2._upper_bound.x or rect1.y + rect1.h - circle._vel.y < rect2._lower_bound.y or rect1.y + circle._vel.y > rect2._upper_bound.y)
-                if not_overlapping:
-                    nodes_to_redraw.append(node)
-                    # aabb_tree = aabb_tree.update_tree(circles)
-                    # break
-
-                    # new_node = AABBNode(is_leaf=True, indx=node._indx, rect=circle.rect)
-                    # aabb_tree.delete_leaf_node(node)
-                    # aabb_tree.insert_node(new_node)
-                else:
-                    # always update at least the leaf bounding box but don't change its parent by walking up!!!
-                    # otherwise it will never redraw because it keeps changing the bounds
-                    node._bounding_box = AABB(Vector2(rect1.topleft), Vector2(rect1.bottomright))
-        
-        for node in nodes_to_redraw:
-            new_node = AABBNode(is_leaf=True, indx=node._indx, rect=circles[node._indx].rect)
-            aabb_tree.delete_leaf_node(node)
-            aabb_tree.insert_from_root(new_node)
-
-            # new_rect = circles[node._indx].rect
-            # aabb_tree.update_node(node, AABB(Vector2(new_rect.topleft), Vector2(new_rect.bottomright)))
-
-        # determine which AABBs can collide
-        for i, circle in enumerate(circles):
-            stack = [aabb_tree._root]
-            rect1 = circle.rect
-            while len(stack) > 0:
-                top = stack.pop()
-                num_checks += 1
-                if top._is_leaf:
-                    # handle collision
-                    if top._indx != i and circle.is_colliding_circle(circles[top._indx]):
-                        #circle_combos.append((circle, circles[top._indx]))
-                        circle.reflect_obj(circles[top._indx], dt)
-                else:
-                    rect2 = top._left_child._bounding_box
-                    overlapping = not (rect1.x + rect1.w < rect2._lower_bound.x or rect1.x > rect2._upper_bound.x or rect1.y + rect1.h < rect2._lower_bound.y or rect1.y > rect2._upper_bound.y)
-                    if overlapping:
-                        stack.append(top._left_child)
-                    
-                    rect2 = top._right_child._bounding_box
-                    overlapping = not (rect1.x + rect1.w < rect2._lower_bound.x or rect1.x > rect2._upper_bound.x or rect1.y + rect1.h < rect2._lower_bound.y or rect1.y > rect2._upper_bound.y)
-                    if overlapping:
-                        stack.append(top._right_child)
+    import simulate
 
-            #print(num_checks)
-        
-        for circle in circles:
-            if circle._pos.x - circle._radius < 0:
-                circle._pos.x = circle._radius
-                circle._vel.x = -circle._vel.x
-            if circle._pos.x + circle._radius > SCREEN_WIDTH-1:
-                circle._pos.x = SCREEN_WIDTH-1 - circle._radius
-                circle._vel.x = -circle._vel.x
-            if circle._pos.y - circle._radius < 0:
-                circle._pos.y = circle._radius
-                circle._vel.y = -circle._vel.y
-            if circle._pos.y + circle._radius > SCREEN_HEIGHT-1:
-                circle._pos.y = SCREEN_HEIGHT-1 - circle._radius
-                circle._vel.y = -circle._vel.y
-
-            circle.render(screen)
-        
-        #aabb_tree = aabb_tree.update_tree(circles)
-        aabb_tree.render_tree(screen, pygame.Color(255, 0, 0)) # has little to no effect on framerate
-        #aabb_tree.print_levels()
-
-        # for node in aabb_tree._nodes:
-        #     print(node._indx)
-
-        curr_fps = clock.get_fps()
-        fps_surface = update_fps()
-        total_time += dt
-        total_frames += curr_fps
-        frames_checks += 1
-        reinsertions += len(nodes_to_redraw)
-        # avg fps and checks every 1s
-        if total_time >= 1:
-            avg_framerate = total_frames / frames_checks
-            avg_checks = num_checks / frames_checks
-            reinsertions /= frames_checks
-            
-            avg_check_str = "{:<12}{:10.1f}".format("Avg Checks:", avg_checks)
-            avg_frames_str = "{:<12}{:10.1f}".format("Avg FPS:", avg_framerate)
-            avg_reinserts_str = "{:<12}{:9.1f}".format("Reinsertions:", reinsertions)
-            avg_checks_render = render_text(avg_check_str)
-            avg_frames_render = render_text(avg_frames_str)
-            avg_reinserts_render = render_text(avg_reinserts_str)
-
-            total_time = 0
-            total_frames = 0
-            frames_checks = 0
-            num_checks = 0
-            reinsertions = 0
-
-        # fps rect
-        s = pygame.Surface((250, 90), pygame.SRCALPHA)
-        s.fill((0, 0, 0, 128))
-        screen.blit(s, (0, 0))
-        fps_text = "{:<12}{:10d}".format("Cur FPS:", int(curr_fps))
-        screen.blit(render_text(fps_text), (5, 10))
-        if avg_frames_render:
-            screen.blit(avg_frames_render, (5, 30))
-        if avg_checks_render:
-            screen.blit(avg_checks_render, (5, 50))
-        if avg_reinserts_render:
-            screen.blit(avg_reinserts_render, (5, 70))
-        pygame.display.flip()
-        
-    pygame.quit()
\ No newline at end of file
+    # the debug run is simulate.py --broadphase escape, the strategy this file started with
+    simulate.main(["--broadphase", "escape"] + sys.argv[1:])
@@ -0,0 +1,416 @@
+import pygame
+import numpy as np
+from pygame.math import Vector2
+from pygame.rect import Rect
+
+from aabb import AABB
+from aabb_build import FlatTree, NULL_NODE, build_sah, levels, node_heights, query_many, read_flat_file, save_flat_file
+
+class AABBArrayTree(object):
+    '''AABB tree whose nodes live in flat numpy arrays instead of AABBNode objects.
+
+    Every node is a slot index into the arrays below. Unused slots are chained
+    into a free list through _parent, so allocating and releasing a node is O(1)
+    and no Python object is created per node. Leaves are addressed by their slot
+    index, which is handed out as the proxy handle.
+    '''
+    _bounds: np.ndarray  # (capacity, 4) -> min x, min y, max x, max y
+    _child: np.ndarray   # (capacity, 2) -> left, right slot (NULL_NODE for leaves)
+    _parent: np.ndarray  # parent slot, or next free slot while the slot is unused
+    _height: np.ndarray  # leaves have height 0
+    _indx: np.ndarray    # leaf payload (index into circles), -1 for internal nodes
+    _root: int
+    _free: int
+
+    def __init__(self, capacity: int = 16, margin: float = 10, displacement_multiplier: float = 4):
+        # leaf boxes are fattened the same way AABBTree does it
+        self._margin = margin
+        self._displacement_multiplier = displacement_multiplier
+        # SAH cost right after the last bulk build, refit_boxes compares against it
+        self._build_cost = None
+        # nodes (or node pairs) tested by the last query / query_all_pairs / query_tree
+        self._num_checks = 0
+        self._reset(capacity)
+
+    def _reset(self, capacity: int):
+        self._bounds = np.zeros((0, 4), dtype=np.float64)
+        self._child = np.zeros((0, 2), dtype=np.int32)
+        self._parent = np.zeros(0, dtype=np.int32)
+        self._height = np.zeros(0, dtype=np.int32)
+        self._indx = np.zeros(0, dtype=np.int32)
+        self._root = NULL_NODE
+        self._free = NULL_NODE
+        self._node_count = 0
+        self._grow(max(capacity, 1))
+
+    def _grow(self, capacity: int):
+        '''resize every array to capacity and thread the new slots onto the free list'''
+        old = len(self._parent)
+        self._bounds = self._resized(self._bounds, capacity)
+        self._child = self._resized(self._child, capacity)
+        self._parent = self._resized(self._parent, capacity)
+        self._height = self._resized(self._height, capacity)
+        self._indx = self._resized(self._indx, capacity)
+
+        # new slots point at the next one, the last one at the old free list head
+        self._parent[old:capacity - 1] = np.arange(old + 1, capacity, dtype=np.int32)
+        self._parent[capacity - 1] = self._free
+        self._height[old:] = -1
+        self._free = old
+
+    @staticmethod
+    def _resized(array: np.ndarray, capacity: int) -> np.ndarray:
+        new_array = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        new_array[:len(array)] = array
+        return new_array
+
+    def _allocate_node(self) -> int:
+        if self._free == NULL_NODE:
+            self._grow(2 * len(self._parent))
+
+        node = self._free
+        self._free = int(self._parent[node])
+        self._parent[node] = NULL_NODE
+        self._child[node] = NULL_NODE
+        self._height[node] = 0
+        self._indx[node] = -1
+        self._node_count += 1
+        return node
+
+    def _free_node(self, node: int):
+        self._parent[node] = self._free
+        self._height[node] = -1
+        self._free = node
+        self._node_count -= 1
+
+    def build_from_boxes(self, boxes: np.ndarray, builder=build_sah):
+        '''replaces the contents with a bulk build over boxes, leaf payloads are box indices'''
+        self.load_flat(builder(boxes))
+
+    def refit_boxes(self, boxes: np.ndarray, rebuild_ratio: float = 1.5, builder=build_sah) -> bool:
+        '''refit-only update: copies boxes[i] into the leaf carrying indx i, refits the internal
+        boxes one level at a time from the bottom, and rebuilds once the SAH cost passes
+        rebuild_ratio times the cost of the last build. returns True if it rebuilt'''
+        if self._root == NULL_NODE:
+            return False
+
+        live = np.nonzero(self._height >= 0)[0]
+        leaves = live[self._child[live, 0] == NULL_NODE]
+        self._bounds[leaves] = boxes[self._indx[leaves]]
+        view = FlatTree(self._bounds, self._child, self._parent, self._indx, self._root)
+        for level in reversed(levels(view)):
+            inner = level[self._child[level, 0] != NULL_NODE]
+            left = self._child[inner, 0]
+            right = self._child[inner, 1]
+            self._bounds[inner, :2] = np.minimum(self._bounds[left, :2], self._bounds[right, :2])
+            self._bounds[inner, 2:] = np.maximum(self._bounds[left, 2:], self._bounds[right, 2:])
+
+        cost = self.sah_cost()
+        if self._build_cost is None:
+            self._build_cost = cost
+        if cost > rebuild_ratio * self._build_cost:
+            self.build_from_boxes(boxes, builder)
+            return True
+        return False
+
+    def sah_cost(self) -> float:
+        '''sum of the internal node areas'''
+        inner = (self._height > 0)
+        size = self._bounds[inner, 2:] - self._bounds[inner, :2]
+        return float((size[:, 0] * size[:, 1]).sum())
+
+    def load_flat(self, flat: FlatTree):
+        '''adopts the arrays of a built tree directly, leaving the spare slots on the free list'''
+        num_nodes = len(flat.parent)
+        self._reset(max(2 * num_nodes, 16))
+        if num_nodes == 0:
+            return
+
+        self._bounds[:num_nodes] = flat.bounds
+        self._child[:num_nodes] = flat.child
+        self._parent[:num_nodes] = flat.parent
+        self._height[:num_nodes] = node_heights(flat)
+        self._indx[:num_nodes] = flat.indx
+        self._root = int(flat.root)
+        self._parent[num_nodes:-1] = np.arange(num_nodes + 1, len(self._parent), dtype=np.int32)
+        self._parent[-1] = NULL_NODE
+        self._free = num_nodes
+        self._node_count = num_nodes
+        self._build_cost = self.sah_cost()
+
+    def to_flat(self) -> FlatTree:
+        '''compacted copy of the live nodes, renumbered root first'''
+        view = FlatTree(self._bounds, self._child, self._parent, self._indx, self._root)
+        if self._root == NULL_NODE:
+            return FlatTree(self._bounds[:0], self._child[:0], self._parent[:0], self._indx[:0], NULL_NODE)
+
+        order = np.concatenate(levels(view))
+        new_id = np.full(len(self._parent), NULL_NODE, dtype=np.int32)
+        new_id[order] = np.arange(len(order), dtype=np.int32)
+        child = self._child[order]
+        child = np.where(child == NULL_NODE, NULL_NODE, new_id[child])
+        parent = self._parent[order]
+        parent = np.where(parent == NULL_NODE, NULL_NODE, new_id[parent])
+        return FlatTree(self._bounds[order], child, parent, self._indx[order], 0)
+
+    def save(self, path: str):
+        save_flat_file(self.to_flat(), path)
+
+    @staticmethod
+    def load(path: str, mmap: bool = True, margin: float = 10, displacement_multiplier: float = 4) -> 'AABBArrayTree':
+        '''reads a snapshot written by save, same call as AABBTree.load. with mmap the slot arrays
+        are copy-on-write maps of the file, only heights are computed, and the first new node
+        copies them into memory'''
+        tree = AABBArrayTree(margin=margin, displacement_multiplier=displacement_multiplier)
+        flat = read_flat_file(path, mmap)
+        if not mmap or flat.root == NULL_NODE:
+            tree.load_flat(flat)
+            return tree
+
+        tree._bounds = flat.bounds
+        tree._child = flat.child
+        tree._parent = flat.parent
+        tree._indx = flat.indx
+        tree._height = node_heights(flat)
+        tree._root = flat.root
+        tree._free = NULL_NODE
+        tree._node_count = len(flat.parent)
+        tree._build_cost = tree.sah_cost()
+        return tree
+
+    def is_leaf(self, node: int) -> bool:
+        return self._child[node, 0] == NULL_NODE
+
+    def create_proxy(self, aabb: AABB, indx: int) -> int:
+        '''insert a fattened leaf for aabb carrying indx, returns the handle used to move/destroy it'''
+        leaf = self._allocate_node()
+        self.set_leaf_bounds(leaf, aabb.fattened(self._margin))
+        self._indx[leaf] = indx
+        self.insert_leaf(leaf)
+        return leaf
+
+    def destroy_proxy(self, handle: int):
+        self.remove_leaf(handle)
+        self._free_node(handle)
+
+    def update_proxy(self, handle: int, aabb: AABB):
+        '''overwrite the leaf box and refit its ancestors without changing the topology'''
+        self.set_leaf_bounds(handle, aabb)
+        self.refit_ancestors(int(self._parent[handle]))
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''same contract as AABBTree.move_proxy: reinsert only once the tight box leaves the fat one'''
+        x0, y0, x1, y1 = self._bounds[handle].tolist()
+        if (x0 <= new_aabb._min_x and y0 <= new_aabb._min_y
+                and new_aabb._max_x <= x1 and new_aabb._max_y <= y1):
+            return False
+
+        if displacement is not None:
+            displacement = displacement * self._displacement_multiplier
+        self.remove_leaf(handle)
+        self.set_leaf_bounds(handle, new_aabb.fattened(self._margin, displacement))
+        self.insert_leaf(handle)
+        return True
+
+    def set_leaf_bounds(self, handle: int, aabb: AABB):
+        self._bounds[handle] = (aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y)
+
+    def get_indx(self, handle: int) -> int:
+        return int(self._indx[handle])
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return AABB(*self._bounds[handle].tolist())
+
+    def insert_leaf(self, leaf: int):
+        if self._root == NULL_NODE:
+            self._root = leaf
+            self._parent[leaf] = NULL_NODE
+            return
+
+        # find the best sibling by walking down, using the change in area as the cost
+        lx0, ly0, lx1, ly1 = self._bounds[leaf].tolist()
+        index = self._root
+        while self._child[index, 0] != NULL_NODE:
+            left, right = self._child[index].tolist()
+            x0, y0, x1, y1 = self._bounds[index].tolist()
+            area = (x1 - x0) * (y1 - y0)
+            combined_area = (max(x1, lx1) - min(x0, lx0)) * (max(y1, ly1) - min(y0, ly0))
+
+            # cost of making a new parent for this node and the new leaf
+            cost = 2 * combined_area
+            # minimum cost of pushing the leaf further down the tree
+            inheritance_cost = 2 * (combined_area - area)
+
+            cost_left = self._descend_cost(left, lx0, ly0, lx1, ly1) + inheritance_cost
+            cost_right = self._descend_cost(right, lx0, ly0, lx1, ly1) + inheritance_cost
+
+            if cost < cost_left and cost < cost_right:
+                break
+            index = left if cost_left < cost_right else right
+
+        sibling = index
+        old_parent = int(self._parent[sibling])
+        new_parent = self._allocate_node()
+        self._parent[new_parent] = old_parent
+        self._child[new_parent] = (sibling, leaf)
+        self._parent[sibling] = new_parent
+        self._parent[leaf] = new_parent
+
+        if old_parent == NULL_NODE:
+            self._root = new_parent
+        elif self._child[old_parent, 0] == sibling:
+            self._child[old_parent, 0] = new_parent
+        else:
+            self._child[old_parent, 1] = new_parent
+
+        self.refit_ancestors(new_parent)
+
+    def _descend_cost(self, node: int, lx0: float, ly0: float, lx1: float, ly1: float) -> float:
+        x0, y0, x1, y1 = self._bounds[node].tolist()
+        union_area = (max(x1, lx1) - min(x0, lx0)) * (max(y1, ly1) - min(y0, ly0))
+        if self._child[node, 0] == NULL_NODE:
+            return union_area
+        return union_area - (x1 - x0) * (y1 - y0)
+
+    def remove_leaf(self, leaf: int):
+        if leaf == self._root:
+            self._root = NULL_NODE
+            return
+
+        parent = int(self._parent[leaf])
+        grandparent = int(self._parent[parent])
+        left, right = self._child[parent].tolist()
+        sibling = right if left == leaf else left
+
+        if grandparent == NULL_NODE:
+            self._root = sibling
+            self._parent[sibling] = NULL_NODE
+        else:
+            if self._child[grandparent, 0] == parent:
+                self._child[grandparent, 0] = sibling
+            else:
+                self._child[grandparent, 1] = sibling
+            self._parent[sibling] = grandparent
+            self.refit_ancestors(grandparent)
+
+        self._free_node(parent)
+
+    def refit_ancestors(self, node: int):
+        '''walk back up the tree from node, recomputing bounds and heights'''
+        bounds = self._bounds
+        while node != NULL_NODE:
+            left, right = self._child[node].tolist()
+            bounds[node, :2] = np.minimum(bounds[left, :2], bounds[right, :2])
+            bounds[node, 2:] = np.maximum(bounds[left, 2:], bounds[right, 2:])
+            self._height[node] = 1 + max(self._height[left], self._height[right])
+            node = int(self._parent[node])
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every leaf whose box overlaps aabb'''
+        self._num_checks = 0
+        if self._root == NULL_NODE:
+            return
+
+        qx0, qy0 = aabb._min_x, aabb._min_y
+        qx1, qy1 = aabb._max_x, aabb._max_y
+        bounds = self._bounds
+        child = self._child
+        stack = [self._root]
+        while len(stack) > 0:
+            top = stack.pop()
+            self._num_checks += 1
+            x0, y0, x1, y1 = bounds[top].tolist()
+            if qx1 < x0 or qx0 > x1 or qy1 < y0 or qy0 > y1:
+                continue
+            left, right = child[top].tolist()
+            if left == NULL_NODE:
+                yield int(self._indx[top])
+            else:
+                stack.append(left)
+                stack.append(right)
+
+    def query_many(self, boxes: np.ndarray):
+        '''batched overlap query straight on the node arrays, returns (offsets, candidates):
+        candidates[offsets[i]:offsets[i + 1]] overlap boxes[i]'''
+        offsets, candidates, self._num_checks = query_many(FlatTree(self._bounds, self._child, self._parent, self._indx, self._root), boxes)
+        return offsets, candidates
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) once for every pair of overlapping leaves, same descent as AABBTree'''
+        self._num_checks = 0
+        if self._root == NULL_NODE:
+            return
+
+        bounds = self._bounds.tolist()
+        child = self._child.tolist()
+        stack = [(self._root, self._root)]
+        while len(stack) > 0:
+            node_a, node_b = stack.pop()
+            self._num_checks += 1
+            left_a, right_a = child[node_a]
+            if node_a == node_b:
+                if left_a != NULL_NODE:
+                    stack.append((left_a, left_a))
+                    stack.append((right_a, right_a))
+                    stack.append((left_a, right_a))
+                continue
+
+            ax0, ay0, ax1, ay1 = bounds[node_a]
+            bx0, by0, bx1, by1 = bounds[node_b]
+            if ax1 < bx0 or ax0 > bx1 or ay1 < by0 or ay0 > by1:
+                continue
+
+            left_b, right_b = child[node_b]
+            if left_a == NULL_NODE and left_b == NULL_NODE:
+                yield (int(self._indx[node_a]), int(self._indx[node_b]))
+            elif left_b == NULL_NODE or (left_a != NULL_NODE and (ax1 - ax0) * (ay1 - ay0) >= (bx1 - bx0) * (by1 - by0)):
+                stack.append((left_a, node_b))
+                stack.append((right_a, node_b))
+            else:
+                stack.append((node_a, left_b))
+                stack.append((node_a, right_b))
+
+    def query_tree(self, other):
+        '''yields (indx in self, indx in other) for every pair of overlapping leaves across two
+        trees. other is another AABBArrayTree, or an AABBTree, whose descent does the work'''
+        if not isinstance(other, AABBArrayTree):
+            for indx_b, indx_a in other.query_array_tree(self):
+                yield (indx_a, indx_b)
+            self._num_checks = other._num_checks
+            return
+
+        self._num_checks = 0
+        if self._root == NULL_NODE or other._root == NULL_NODE:
+            return
+
+        stack = [(self._root, other._root)]
+        while len(stack) > 0:
+            node_a, node_b = stack.pop()
+            self._num_checks += 1
+            ax0, ay0, ax1, ay1 = self._bounds[node_a].tolist()
+            bx0, by0, bx1, by1 = other._bounds[node_b].tolist()
+            if ax1 < bx0 or ax0 > bx1 or ay1 < by0 or ay0 > by1:
+                continue
+
+            left_a, right_a = self._child[node_a].tolist()
+            left_b, right_b = other._child[node_b].tolist()
+            if left_a == NULL_NODE and left_b == NULL_NODE:
+                yield (int(self._indx[node_a]), int(other._indx[node_b]))
+            elif left_b == NULL_NODE or (left_a != NULL_NODE and (ax1 - ax0) * (ay1 - ay0) >= (bx1 - bx0) * (by1 - by0)):
+                stack.append((left_a, node_b))
+                stack.append((right_a, node_b))
+            else:
+                stack.append((node_a, left_b))
+                stack.append((node_a, right_b))
+
+    def render_tree(self, screen, color):
+        for node in range(len(self._parent)):
+            if self._height[node] < 0:
+                continue
+            x0, y0, x1, y1 = self._bounds[node].tolist()
+            rect: Rect = Rect(x0, y0, x1 - x0, y1 - y0)
+            if self._child[node, 0] == NULL_NODE:
+                pygame.draw.rect(screen, pygame.Color(0, 255, 0), rect, 1)
+            else:
+                pygame.draw.rect(screen, color, rect, 1)
+                color.g = (color.g + 30) % 255
@@ -0,0 +1,419 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple
+
+NULL_NODE = -1
+
+class FlatTree(NamedTuple):
+    '''a built hierarchy in array form, the same layout AABBArrayTree uses for its slots'''
+    bounds: np.ndarray  # (num_nodes, 4) -> min x, min y, max x, max y
+    child: np.ndarray   # (num_nodes, 2) -> left, right (NULL_NODE for leaves)
+    parent: np.ndarray  # NULL_NODE for the root
+    indx: np.ndarray    # leaf payload (index into the input boxes), -1 for internal nodes
+    root: int
+
+# snapshot layout: header, then bounds (<f8, num_nodes x 4), child (<i4, num_nodes x 2),
+# parent (<i4, num_nodes) and indx (<i4, num_nodes), back to back with no padding
+TREE_FILE_MAGIC = b"AABB"
+TREE_FILE_VERSION = 1
+TREE_FILE_HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("num_nodes", "<u4"), ("root", "<i4")])
+
+def boxes_from_rects(rects) -> np.ndarray:
+    '''(N, 4) array of min x, min y, max x, max y from pygame rects'''
+    boxes = np.array([(r.x, r.y, r.x + r.w, r.y + r.h) for r in rects], dtype=np.float64)
+    return boxes.reshape(-1, 4)
+
+def empty_flat_tree() -> FlatTree:
+    return FlatTree(np.zeros((0, 4)), np.zeros((0, 2), dtype=np.int32),
+                    np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), NULL_NODE)
+
+def build_sah(boxes: np.ndarray, num_bins: int = 16) -> FlatTree:
+    '''top-down binned surface area heuristic build, one primitive per leaf.
+
+    Instead of recursing one node at a time, every node of a level is split at
+    once: primitives of the same node are kept contiguous in prims, and binning,
+    the prefix/suffix sweeps and the partition are done with array operations
+    over all of those segments together. The loop runs once per tree level.
+    '''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        return empty_flat_tree()
+
+    num_nodes = 2 * n - 1
+    bounds = np.zeros((num_nodes, 4), dtype=np.float64)
+    child = np.full((num_nodes, 2), NULL_NODE, dtype=np.int32)
+    parent = np.full(num_nodes, NULL_NODE, dtype=np.int32)
+    indx = np.full(num_nodes, -1, dtype=np.int32)
+    centroids = 0.5 * (boxes[:, :2] + boxes[:, 2:])
+
+    # active segments: prims[starts[i]:starts[i] + counts[i]] belong to node nodes[i]
+    prims = np.arange(n)
+    starts = np.array([0])
+    counts = np.array([n])
+    nodes = np.array([0])
+    next_node = 1
+
+    while len(nodes) > 0:
+        seg_boxes = boxes[prims]
+        bounds[nodes, :2] = np.minimum.reduceat(seg_boxes[:, :2], starts)
+        bounds[nodes, 2:] = np.maximum.reduceat(seg_boxes[:, 2:], starts)
+
+        # single primitive segments are finished leaves
+        is_leaf = counts == 1
+        indx[nodes[is_leaf]] = prims[starts[is_leaf]]
+        keep = np.repeat(~is_leaf, counts)
+        prims = prims[keep]
+        nodes = nodes[~is_leaf]
+        counts = counts[~is_leaf]
+        if len(nodes) == 0:
+            break
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        num_segs = len(nodes)
+        seg = np.repeat(np.arange(num_segs), counts)
+        seg_boxes = boxes[prims]
+        seg_centroids = centroids[prims]
+        cmin = np.minimum.reduceat(seg_centroids, starts)
+        extent = np.maximum.reduceat(seg_centroids, starts) - cmin
+
+        best_cost = np.full(num_segs, np.inf)
+        best_axis = np.zeros(num_segs, dtype=np.int64)
+        best_split = np.zeros(num_segs, dtype=np.int64)
+        prim_bins = np.zeros((2, len(prims)), dtype=np.int64)
+        for axis in (0, 1):
+            scale = np.where(extent[:, axis] > 0, num_bins / np.maximum(extent[:, axis], 1e-300), 0)
+            bins = ((seg_centroids[:, axis] - cmin[seg, axis]) * scale[seg]).astype(np.int64)
+            bins = np.minimum(bins, num_bins - 1)
+            prim_bins[axis] = bins
+            key = seg * num_bins + bins
+
+            bin_count = np.bincount(key, minlength=num_segs * num_bins).reshape(num_segs, num_bins)
+            bin_lo = np.full((num_segs * num_bins, 2), np.inf)
+            bin_hi = np.full((num_segs * num_bins, 2), -np.inf)
+            np.minimum.at(bin_lo, key, seg_boxes[:, :2])
+            np.maximum.at(bin_hi, key, seg_boxes[:, 2:])
+            bin_lo = bin_lo.reshape(num_segs, num_bins, 2)
+            bin_hi = bin_hi.reshape(num_segs, num_bins, 2)
+
+            # sweep from the left and from the right, splitting after bin k
+            left_count = np.cumsum(bin_count, axis=1)
+            left_area = sweep_area(bin_lo, bin_hi, left_count)
+            right_count = np.cumsum(bin_count[:, ::-1], axis=1)[:, ::-1]
+            right_area = sweep_area(bin_lo[:, ::-1], bin_hi[:, ::-1], right_count[:, ::-1])[:, ::-1]
+
+            cost = left_area[:, :-1] * left_count[:, :-1] + right_area[:, 1:] * right_count[:, 1:]
+            cost[(left_count[:, :-1] == 0) | (right_count[:, 1:] == 0)] = np.inf
+            split = np.argmin(cost, axis=1)
+            split_cost = cost[np.arange(num_segs), split]
+
+            better = split_cost < best_cost
+            best_cost[better] = split_cost[better]
+            best_axis[better] = axis
+            best_split[better] = split[better]
+
+        go_left = prim_bins[best_axis[seg], np.arange(len(prims))] <= best_split[seg]
+        # every centroid fell in one bin (e.g. stacked circles), split the segment in half
+        no_split = ~np.isfinite(best_cost)[seg]
+        position = np.arange(len(prims)) - starts[seg]
+        go_left[no_split] = position[no_split] < counts[seg][no_split] // 2
+
+        order = np.lexsort((~go_left, seg))
+        prims = prims[order]
+        num_left = np.bincount(seg, weights=go_left, minlength=num_segs).astype(np.int64)
+
+        children = next_node + np.arange(2 * num_segs).reshape(num_segs, 2)
+        next_node += 2 * num_segs
+        child[nodes] = children
+        parent[children[:, 0]] = nodes
+        parent[children[:, 1]] = nodes
+
+        nodes = children.ravel()
+        counts = np.stack((num_left, counts - num_left), axis=1).ravel()
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    return FlatTree(bounds, child, parent, indx, 0)
+
+def sweep_area(bin_lo: np.ndarray, bin_hi: np.ndarray, count: np.ndarray) -> np.ndarray:
+    '''area of the running union of bins along axis 1 (0 while no bin is occupied yet)'''
+    lo = np.minimum.accumulate(bin_lo, axis=1)
+    hi = np.maximum.accumulate(bin_hi, axis=1)
+    size = hi - lo
+    return np.where(count > 0, size[..., 0] * size[..., 1], 0)
+
+def levels(flat: FlatTree) -> List[np.ndarray]:
+    '''node ids grouped by depth, root first'''
+    result = []
+    frontier = np.array([flat.root]) if flat.root != NULL_NODE else np.zeros(0, dtype=np.int64)
+    while len(frontier) > 0:
+        result.append(frontier)
+        inner = frontier[flat.child[frontier, 0] != NULL_NODE]
+        frontier = flat.child[inner].ravel()
+    return result
+
+def node_heights(flat: FlatTree) -> np.ndarray:
+    '''height of every node (leaves are 0), filled in bottom-up one level at a time'''
+    heights = np.zeros(len(flat.parent), dtype=np.int32)
+    for level in reversed(levels(flat)):
+        inner = level[flat.child[level, 0] != NULL_NODE]
+        heights[inner] = 1 + np.maximum(heights[flat.child[inner, 0]], heights[flat.child[inner, 1]])
+    return heights
+
+def query_many(flat: FlatTree, boxes: np.ndarray):
+    """overlap query for many boxes at once, walking the tree one level at a time.
+
+    The frontier is a pair of arrays (query id, node id); each step tests every
+    pair of the frontier with one vectorized comparison and replaces the inner
+    nodes that passed with their two children. Returns CSR style arrays:
+    the leaf payloads overlapping boxes[q] are candidates[offsets[q]:offsets[q + 1]],
+    plus the number of (query, node) tests.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    num_queries = len(boxes)
+    hit_queries = []
+    hit_leaves = []
+    num_checks = 0
+    if flat.root != NULL_NODE and num_queries > 0:
+        queries = np.arange(num_queries)
+        nodes = np.full(num_queries, flat.root)
+        while len(nodes) > 0:
+            num_checks += len(nodes)
+            node_bounds = flat.bounds[nodes]
+            query_bounds = boxes[queries]
+            overlapping = ~((query_bounds[:, 2] < node_bounds[:, 0]) | (query_bounds[:, 0] > node_bounds[:, 2])
+                            | (query_bounds[:, 3] < node_bounds[:, 1]) | (query_bounds[:, 1] > node_bounds[:, 3]))
+            queries = queries[overlapping]
+            nodes = nodes[overlapping]
+
+            is_leaf = flat.child[nodes, 0] == NULL_NODE
+            hit_queries.append(queries[is_leaf])
+            hit_leaves.append(flat.indx[nodes[is_leaf]])
+            queries = np.repeat(queries[~is_leaf], 2)
+            nodes = flat.child[nodes[~is_leaf]].ravel()
+
+    if len(hit_queries) == 0:
+        return np.zeros(num_queries + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), num_checks
+
+    hit_queries = np.concatenate(hit_queries)
+    hit_leaves = np.concatenate(hit_leaves)
+    order = np.argsort(hit_queries, kind="stable")
+    offsets = np.zeros(num_queries + 1, dtype=np.int64)
+    np.cumsum(np.bincount(hit_queries, minlength=num_queries), out=offsets[1:])
+    return offsets, hit_leaves[order], num_checks
+
+def save_flat_file(flat: FlatTree, path: str):
+    header = np.array([(TREE_FILE_MAGIC, TREE_FILE_VERSION, len(flat.parent), flat.root)], dtype=TREE_FILE_HEADER)
+    with open(path, "wb") as f:
+        header.tofile(f)
+        np.ascontiguousarray(flat.bounds, dtype="<f8").tofile(f)
+        np.ascontiguousarray(flat.child, dtype="<i4").tofile(f)
+        np.ascontiguousarray(flat.parent, dtype="<i4").tofile(f)
+        np.ascontiguousarray(flat.indx, dtype="<i4").tofile(f)
+
+def read_flat_file(path: str, mmap: bool = True) -> FlatTree:
+    """reads a snapshot written by save_flat_file. with mmap the arrays are copy-on-write
+    views of the file, so nothing is read until a query touches it"""
+    header = np.fromfile(path, dtype=TREE_FILE_HEADER, count=1)
+    if len(header) == 0 or header[0]["magic"] != TREE_FILE_MAGIC:
+        raise ValueError("{} is not an AABB tree snapshot".format(path))
+    if header[0]["version"] != TREE_FILE_VERSION:
+        raise ValueError("{} has snapshot version {}, expected {}".format(path, header[0]["version"], TREE_FILE_VERSION))
+
+    num_nodes = int(header[0]["num_nodes"])
+    if num_nodes == 0:
+        return empty_flat_tree()
+
+    offset = TREE_FILE_HEADER.itemsize
+    sections = []
+    for dtype, shape in (("<f8", (num_nodes, 4)), ("<i4", (num_nodes, 2)), ("<i4", (num_nodes,)), ("<i4", (num_nodes,))):
+        if mmap:
+            section = np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape)
+        else:
+            section = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        offset += section.nbytes
+        sections.append(section)
+
+    return FlatTree(sections[0], sections[1], sections[2], sections[3], int(header[0]["root"]))
+
+def morton_codes(centres: np.ndarray) -> np.ndarray:
+    '''30 bit morton codes (15 bits per axis) of points normalized to their bounding box'''
+    lo = centres.min(axis=0)
+    extent = np.maximum(centres.max(axis=0) - lo, 1e-9)
+    quantized = np.minimum(((centres - lo) / extent * 32768).astype(np.uint64), 32767)
+    return (spread_bits(quantized[:, 1]) << np.uint64(1)) | spread_bits(quantized[:, 0])
+
+def spread_bits(x: np.ndarray) -> np.ndarray:
+    '''inserts a zero bit between each of the low 15 bits of x'''
+    x = x & np.uint64(0x0000ffff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00ff00ff)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0f0f0f0f)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x33333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x55555555)
+    return x
+
+# based on Karras, "Maximizing Parallelism in the Construction of BVHs, Octrees, and k-d Trees" (2012)
+def build_lbvh(boxes: np.ndarray) -> FlatTree:
+    '''linear BVH: sort the box centres along a morton curve and read the hierarchy off
+    the sorted codes.
+
+    Internal nodes are 0..n-2 (root 0) and leaves n-1..2n-2 in curve order. Every
+    internal node finds its range and split on its own, so the whole topology comes
+    from a few vectorized binary searches over the sorted codes. Common prefix
+    lengths are compared through the highest set bit of the xor of two keys.
+    '''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        return empty_flat_tree()
+
+    num_nodes = 2 * n - 1
+    bounds = np.zeros((num_nodes, 4), dtype=np.float64)
+    child = np.full((num_nodes, 2), NULL_NODE, dtype=np.int32)
+    parent = np.full(num_nodes, NULL_NODE, dtype=np.int32)
+    indx = np.full(num_nodes, -1, dtype=np.int32)
+
+    codes = morton_codes(0.5 * (boxes[:, :2] + boxes[:, 2:]))
+    order = np.argsort(codes, kind="stable")
+    bounds[n - 1:] = boxes[order]
+    indx[n - 1:] = order
+    if n == 1:
+        return FlatTree(bounds, child, parent, indx, 0)
+
+    # appending the sorted position makes every key unique, so duplicate codes still split
+    keys = (codes[order] << np.uint64(32)) | np.arange(n, dtype=np.uint64)
+    no_prefix = np.uint64(np.iinfo(np.uint64).max)
+
+    def key_xor(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        valid = (j >= 0) & (j < n)
+        result = np.full(len(i), no_prefix)
+        result[valid] = keys[i[valid]] ^ keys[j[valid]]
+        return result
+
+    def longer_prefix(xor_a: np.ndarray, xor_b: np.ndarray) -> np.ndarray:
+        # highest set bit of xor_a is below the one of xor_b
+        return (xor_a < xor_b) & (xor_a < (xor_a ^ xor_b))
+
+    i = np.arange(n - 1)
+    # direction of the range: towards the neighbour sharing the longer prefix
+    d = np.where(longer_prefix(key_xor(i, i + 1), key_xor(i, i - 1)), 1, -1)
+    xor_min = key_xor(i, i - d)
+
+    # upper bound on the range length, then binary search for the other end
+    l_max = np.full(n - 1, 2)
+    growing = longer_prefix(key_xor(i, i + l_max * d), xor_min)
+    while growing.any():
+        l_max[growing] *= 2
+        growing &= longer_prefix(key_xor(i, i + l_max * d), xor_min)
+
+    length = np.zeros(n - 1, dtype=np.int64)
+    step = l_max // 2
+    while (step > 0).any():
+        extend = (step > 0) & longer_prefix(key_xor(i, i + (length + step) * d), xor_min)
+        length[extend] += step[extend]
+        step //= 2
+    j = i + length * d
+
+    # split position: the furthest index that still shares more than the node's prefix
+    xor_node = key_xor(i, j)
+    split = np.zeros(n - 1, dtype=np.int64)
+    step = length.copy()
+    searching = np.ones(n - 1, dtype=bool)
+    while searching.any():
+        step = np.where(searching, (step + 1) // 2, 0)
+        extend = searching & longer_prefix(key_xor(i, i + (split + step) * d), xor_node)
+        split[extend] += step[extend]
+        searching &= step > 1
+    gamma = i + split * d + np.minimum(d, 0)
+
+    left = np.where(np.minimum(i, j) == gamma, n - 1 + gamma, gamma)
+    right = np.where(np.maximum(i, j) == gamma + 1, n + gamma, gamma + 1)
+    child[:n - 1, 0] = left
+    child[:n - 1, 1] = right
+    parent[left] = i
+    parent[right] = i
+
+    flat = FlatTree(bounds, child, parent, indx, 0)
+    for level in reversed(levels(flat)):
+        inner = level[child[level, 0] != NULL_NODE]
+        bounds[inner, :2] = np.minimum(bounds[child[inner, 0], :2], bounds[child[inner, 1], :2])
+        bounds[inner, 2:] = np.maximum(bounds[child[inner, 0], 2:], bounds[child[inner, 1], 2:])
+    return flat
+
+def build_parallel(boxes: np.ndarray, executor=None, builder=build_sah, num_tasks: int = None,
+                   min_task_size: int = 4096) -> FlatTree:
+    '''splits the leaves into num_tasks partitions with median cuts along the wider centroid
+    axis, builds every partition with builder in a worker process and stitches the subtrees
+    under the top levels the cuts made. executor is any concurrent.futures executor, pass
+    one in to keep its processes alive between builds, otherwise a temporary process pool
+    is used. falls back to a plain builder call when partitions would be under min_task_size'''
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if num_tasks is None:
+        num_tasks = os.cpu_count() or 1
+    num_tasks = min(num_tasks, n // min_task_size)
+    if num_tasks < 2:
+        return builder(boxes)
+
+    if executor is None:
+        with ProcessPoolExecutor(num_tasks) as pool:
+            return build_parallel(boxes, pool, builder, num_tasks, min_task_size)
+
+    # top levels, parents are always created before their children
+    centroids = 0.5 * (boxes[:, :2] + boxes[:, 2:])
+    top_parent = []
+    top_child = []
+    parts = []  # (prims, parent top node, side)
+    stack = [(np.arange(n), num_tasks, NULL_NODE, 0)]
+    while len(stack) > 0:
+        prims, tasks, parent, side = stack.pop()
+        if tasks == 1:
+            parts.append((prims, parent, side))
+            continue
+
+        node = len(top_parent)
+        top_parent.append(parent)
+        top_child.append([NULL_NODE, NULL_NODE])
+        if parent != NULL_NODE:
+            top_child[parent][side] = node
+
+        c = centroids[prims]
+        axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+        left_tasks = tasks // 2
+        k = len(prims) * left_tasks // tasks
+        order = np.argpartition(c[:, axis], k)
+        stack.append((prims[order[k:]], tasks - left_tasks, node, 1))
+        stack.append((prims[order[:k]], left_tasks, node, 0))
+
+    futures = [executor.submit(builder, boxes[prims]) for prims, _, _ in parts]
+    subtrees = [future.result() for future in futures]
+
+    num_top = len(top_parent)
+    num_nodes = num_top + sum(len(sub.parent) for sub in subtrees)
+    bounds = np.zeros((num_nodes, 4), dtype=np.float64)
+    child = np.full((num_nodes, 2), NULL_NODE, dtype=np.int32)
+    parent = np.full(num_nodes, NULL_NODE, dtype=np.int32)
+    indx = np.full(num_nodes, -1, dtype=np.int32)
+    child[:num_top] = top_child
+    parent[:num_top] = top_parent
+
+    # subtrees go after the top nodes with their node ids and leaf ids shifted
+    offset = num_top
+    for (prims, top, side), sub in zip(parts, subtrees):
+        end = offset + len(sub.parent)
+        bounds[offset:end] = sub.bounds
+        child[offset:end] = np.where(sub.child == NULL_NODE, NULL_NODE, sub.child + offset)
+        parent[offset:end] = np.where(sub.parent == NULL_NODE, NULL_NODE, sub.parent + offset)
+        indx[offset:end] = np.where(sub.indx >= 0, prims[np.maximum(sub.indx, 0)], -1)
+        parent[offset + sub.root] = top
+        child[top, side] = offset + sub.root
+        offset = end
+
+    for node in range(num_top - 1, -1, -1):
+        left, right = child[node]
+        bounds[node, :2] = np.minimum(bounds[left, :2], bounds[right, :2])
+        bounds[node, 2:] = np.maximum(bounds[left, 2:], bounds[right, 2:])
+
+    return FlatTree(bounds, child, parent, indx, 0)
+
+BUILDERS = {"sah": build_sah, "lbvh": build_lbvh}
@@ -0,0 +1,8 @@
+import sys
+
+import simulate
+
+# simulate.py --broadphase refit: one bulk build that is only refit, rebuilt once --rebuild_ratio is passed.
+# any other simulate.py flag can be passed too
+if __name__ == "__main__":
+    simulate.main(["--broadphase", "refit"] + sys.argv[1:])
@@ -0,0 +1,326 @@
+import itertools
+import math
+from typing import Dict, Iterable, List, Protocol, Tuple
+
+import numpy as np
+from pygame.math import Vector2
+
+from aabb import AABB, AABBNode, AABBTree
+from aabb_array import AABBArrayTree
+from aabb_build import NULL_NODE, build_sah
+from pair_manager import PairManager
+
+class Broadphase(Protocol):
+    '''what simulate.py needs from a broadphase. indx is the circle's index in the runner's
+    list, aabb is the circle's tight (or swept) box, pairs are (indx, indx) candidates for
+    the circle vs circle test'''
+    _num_checks: int  # checks done by the last pairs() or static_pairs()
+
+    def add(self, indx: int, aabb: AABB):
+        ...
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        '''called after every on_tick, returns True if the circle had to be reinserted'''
+        ...
+
+    def remove(self, indx: int):
+        ...
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        ...
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        '''(indx, static indx) for every box touching a leaf of static_tree. tree backed
+        broadphases descend both trees at once, the rest fall back to query_each'''
+        ...
+
+    def stats(self) -> List[Tuple[str, str]]:
+        '''extra (label, value) lines for the overlay, asked for once a second'''
+        ...
+
+    def render(self, screen, color):
+        ...
+
+def tree_stats(tree) -> List[Tuple[str, str]]:
+    '''height, leaf depth and sibling overlap lines for an AABBTree, just the height for an AABBArrayTree,
+    nothing for anything else'''
+    if isinstance(tree, AABBArrayTree) and tree._root != NULL_NODE:
+        leaves = (tree._node_count + 1) // 2
+        optimal_height = math.ceil(math.log2(leaves)) if leaves > 1 else 0
+        return [("Height:", "{}/{}".format(int(tree._height[tree._root]), optimal_height))]
+    if not isinstance(tree, AABBTree) or tree._root is None:
+        return []
+    report = tree.balance_report()
+    tree.reset_visits()
+    return [("Height:", "{}/{}".format(report["height"], report["optimal_height"])),
+            ("Leaf Depth:", "{}-{}".format(report["min_leaf_depth"], report["max_leaf_depth"])),
+            ("Overlap:", "{:.1f}%".format(100 * report["sibling_overlap"] / max(report["sah"], 1)))]
+
+def query_each(boxes: Iterable[Tuple[int, AABB]], static_tree: AABBArrayTree) -> Tuple[List[Tuple[int, int]], int]:
+    '''static_pairs for broadphases without a tree to descend: every (indx, box) goes through
+    one batched static_tree.query_many. returns the pairs and the nodes visited'''
+    boxes = list(boxes)
+    if len(boxes) == 0:
+        return [], 0
+    offsets, candidates = static_tree.query_many(np.array([(b._min_x, b._min_y, b._max_x, b._max_y) for _, b in boxes]))
+    owners = np.repeat([indx for indx, _ in boxes], np.diff(offsets))
+    return list(zip(owners.tolist(), candidates.tolist())), static_tree._num_checks
+
+class BruteForceBroadphase(object):
+    '''every combination of circles, what combinations.py does'''
+    _boxes: Dict[int, AABB]
+
+    def __init__(self):
+        self._boxes = {}
+        self._num_checks = 0
+
+    def add(self, indx: int, aabb: AABB):
+        self._boxes[indx] = aabb
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        self._boxes[indx] = aabb
+        return False
+
+    def remove(self, indx: int):
+        del self._boxes[indx]
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        n = len(self._boxes)
+        self._num_checks = n * (n - 1) // 2
+        return itertools.combinations(self._boxes, 2)
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        found, self._num_checks = query_each(self._boxes.items(), static_tree)
+        return found
+
+    def stats(self) -> List[Tuple[str, str]]:
+        return []
+
+    def render(self, screen, color):
+        pass
+
+class RebuildBroadphase(object):
+    '''bulk builds a fresh tree over every box each frame, what aabb_rebuild.py does. the tree
+    is an AABBArrayTree, which adopts the builder's arrays as they are instead of making a
+    node object per node'''
+    _boxes: Dict[int, AABB]
+    _tree: AABBArrayTree
+    _order: List[int]  # leaf i is circle _order[i]
+
+    def __init__(self, builder=build_sah):
+        self._builder = builder
+        self._boxes = {}
+        self._order = []
+        self._tree = AABBArrayTree()
+        self._num_checks = 0
+
+    def add(self, indx: int, aabb: AABB):
+        self._boxes[indx] = aabb
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        # nothing to do until pairs(), but every circle goes back in
+        self._boxes[indx] = aabb
+        return True
+
+    def remove(self, indx: int):
+        del self._boxes[indx]
+
+    def box_array(self) -> np.ndarray:
+        boxes = np.array([(b._min_x, b._min_y, b._max_x, b._max_y) for b in self._boxes.values()], dtype=np.float64)
+        return boxes.reshape(-1, 4)
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        # leaf i of the build is the i-th box in the dict
+        self._order = list(self._boxes)
+        self._tree.build_from_boxes(self.box_array(), self._builder)
+        for i, j in self._tree.query_all_pairs():
+            yield (self._order[i], self._order[j])
+        self._num_checks = self._tree._num_checks
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        for i, static_indx in self._tree.query_tree(static_tree):
+            yield (self._order[i], static_indx)
+        self._num_checks = self._tree._num_checks
+
+    def stats(self) -> List[Tuple[str, str]]:
+        return tree_stats(self._tree)
+
+    def render(self, screen, color):
+        self._tree.render_tree(screen, color)
+
+class RefitBroadphase(RebuildBroadphase):
+    '''keeps one bulk built AABBArrayTree and only refits it each frame, rebuilding once its SAH cost
+    passes rebuild_ratio times the last build's, what aabb_refit.py does'''
+
+    def __init__(self, builder=build_sah, rebuild_ratio: float = 1.5):
+        super().__init__(builder)
+        self._rebuild_ratio = rebuild_ratio
+        self._rebuilds = 0
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        self._boxes[indx] = aabb
+        return False
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        order = list(self._boxes)
+        if order != self._order:
+            # circles came or went, the leaves no longer line up so start over
+            self._order = order
+            self._tree.build_from_boxes(self.box_array(), self._builder)
+            self._rebuilds += 1
+        elif self._tree.refit_boxes(self.box_array(), self._rebuild_ratio, self._builder):
+            self._rebuilds += 1
+        for i, j in self._tree.query_all_pairs():
+            yield (order[i], order[j])
+        self._num_checks = self._tree._num_checks
+
+    def stats(self) -> List[Tuple[str, str]]:
+        rebuilds = self._rebuilds
+        self._rebuilds = 0
+        return [("Rebuilds:", str(rebuilds))] + tree_stats(self._tree)
+
+class EscapeBroadphase(object):
+    '''AABBTree with tight leaves, a leaf is only reinserted once its circle leaves the
+    parent's box, otherwise just the leaf's own box moves. what aabb_demo.py does'''
+    _leaves: Dict[int, AABBNode]
+    _escaped: List[AABBNode]
+
+    def __init__(self):
+        self._tree = AABBTree()
+        self._leaves = {}
+        self._escaped = []
+        self._num_checks = 0
+
+    def add(self, indx: int, aabb: AABB):
+        node = AABBNode(is_leaf=True, indx=indx, aabb=AABB(aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y))
+        self._leaves[indx] = node
+        self._tree.insert_from_root(node)
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        node = self._leaves[indx]
+        # only the leaf's own box, don't walk up and grow the parent or the leaf would never escape it
+        node._bounding_box.set(aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y)
+        if node._parent is not None and not node._parent._bounding_box.contains(aabb):
+            # reinserted in pairs(), after every leaf has been checked against the old parents
+            self._escaped.append(node)
+            return True
+        return False
+
+    def remove(self, indx: int):
+        node = self._leaves.pop(indx)
+        if node in self._escaped:
+            self._escaped.remove(node)
+        self._tree.delete_leaf_node(node)
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        for node in self._escaped:
+            # reuse the leaf, which already has its new box, and its old parent
+            spare = self._tree.unlink_node(node)
+            node._parent = None
+            self._tree.insert_from_root(node, spare)
+        self._escaped.clear()
+        for pair in self._tree.query_all_pairs():
+            yield pair
+        self._num_checks = self._tree._num_checks
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        for pair in self._tree.query_tree(static_tree):
+            yield pair
+        self._num_checks = self._tree._num_checks
+
+    def stats(self) -> List[Tuple[str, str]]:
+        return tree_stats(self._tree)
+
+    def render(self, screen, color):
+        self._tree.render_tree(screen, color)
+
+class ProxyBroadphase(object):
+    '''anything with the create / move / destroy_proxy and query_all_pairs surface: AABBTree,
+    AABBArrayTree, SpatialHashGrid, HierarchicalGrid, SweepAndPrune or LooseQuadtree'''
+    _handles: Dict[int, int]  # indx -> handle
+
+    def __init__(self, structure):
+        self._structure = structure
+        self._handles = {}
+        self._num_checks = 0
+
+    def add(self, indx: int, aabb: AABB):
+        self._handles[indx] = self._structure.create_proxy(aabb, indx)
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        return self._structure.move_proxy(self._handles[indx], aabb, displacement)
+
+    def remove(self, indx: int):
+        self._structure.destroy_proxy(self._handles.pop(indx))
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        yield from self._structure.query_all_pairs()
+        self._num_checks = self._structure._num_checks
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        if isinstance(self._structure, (AABBTree, AABBArrayTree)):
+            yield from self._structure.query_tree(static_tree)
+            self._num_checks = self._structure._num_checks
+            return
+
+        boxes = [(indx, self._structure.get_fat_aabb(handle)) for indx, handle in self._handles.items()]
+        found, self._num_checks = query_each(boxes, static_tree)
+        yield from found
+
+    def stats(self) -> List[Tuple[str, str]]:
+        return tree_stats(self._structure)
+
+    def render(self, screen, color):
+        self._structure.render_tree(screen, color)
+
+class ReinsertBroadphase(ProxyBroadphase):
+    '''AABBTree with fat leaves, a leaf is only reinserted when its circle escapes the fat box.
+    optionally spends optimize_ms a frame on AABBTree.optimize'''
+
+    def __init__(self, optimize_ms: float = 0):
+        super().__init__(AABBTree())
+        self._optimize_ms = optimize_ms
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        if self._optimize_ms > 0:
+            self._structure.optimize(self._optimize_ms)
+        return super().pairs()
+
+class PairManagerBroadphase(object):
+    '''fat leaf AABBTree behind a PairManager, only reinserted leaves are requeried and every
+    other pair carries over from last frame. spends optimize_ms a frame on AABBTree.optimize,
+    what aabb_opt.py does'''
+
+    def __init__(self, optimize_ms: float = 0):
+        self._tree = AABBTree()
+        self._pair_manager = PairManager(self._tree)
+        self._optimize_ms = optimize_ms
+        self._num_checks = 0
+
+    def add(self, indx: int, aabb: AABB):
+        self._pair_manager.add_proxy(indx, aabb)
+
+    def move(self, indx: int, aabb: AABB, displacement: Vector2) -> bool:
+        return self._pair_manager.move_proxy(indx, aabb, displacement)
+
+    def remove(self, indx: int):
+        self._pair_manager.remove_proxy(indx)
+
+    def pairs(self) -> Iterable[Tuple[int, int]]:
+        if self._optimize_ms > 0:
+            self._tree.optimize(self._optimize_ms)
+        contacts = self._pair_manager.update_pairs()
+        self._num_checks = self._pair_manager._num_checks
+        return itertools.chain(contacts.begin, contacts.persist)
+
+    def static_pairs(self, static_tree) -> Iterable[Tuple[int, int]]:
+        # PairManager adds the descent onto update_pairs' count
+        checks = self._pair_manager._num_checks
+        yield from self._pair_manager.static_pairs(static_tree)
+        self._num_checks = self._pair_manager._num_checks - checks
+
+    def stats(self) -> List[Tuple[str, str]]:
+        return tree_stats(self._tree)
+
+    def render(self, screen, color):
+        self._tree.render_tree(screen, color)
@@ -15,6 +15,7 @@ class Circle(Sprite):
         Sprite.__init__(self)
         
         self._pos = Vector2(pos_init[0], pos_init[1])
+        self._prev_pos = self._pos.copy()
         self._vel = Vector2(vel_init[0], vel_init[1])
         self._acc = Vector2(acc_init[0], acc_init[1])
         self._radius = radius
@@ -28,7 +29,8 @@ class Circle(Sprite):
                           self._radius * 2)
         
     def on_tick(self, dt):
-        self._prev_pos = self._pos
+        # copy, += below updates _pos in place
+        self._prev_pos = self._pos.copy()
         self._pos += self._vel * dt + 0.5 * self._acc * dt*dt
         self._vel += self._acc * dt
         
@@ -36,10 +38,56 @@ class Circle(Sprite):
         self.rect.centerx = self._pos.x
         self.rect.centery = self._pos.y
         
+    def swept_bounds(self):
+        '''(min x, min y, max x, max y) of everything the circle covered moving from _prev_pos to _pos'''
+        return (min(self._prev_pos.x, self._pos.x) - self._radius, min(self._prev_pos.y, self._pos.y) - self._radius,
+                max(self._prev_pos.x, self._pos.x) + self._radius, max(self._prev_pos.y, self._pos.y) + self._radius)
+
+    def time_of_impact(self, ref):
+        '''fraction of the last step (0 to 1) at which the two circles first touched, moving in a
+        straight line from _prev_pos to _pos. 0 if they already overlapped, None if they never met'''
+        start = self._prev_pos - ref._prev_pos
+        motion = (self._pos - self._prev_pos) - (ref._pos - ref._prev_pos)
+        radius = self._radius + ref._radius
+        c = start.dot(start) - radius * radius
+        if c <= 0:
+            return 0
+        a = motion.dot(motion)
+        b = 2 * motion.dot(start)
+        disc = b * b - 4 * a * c
+        if a == 0 or b >= 0 or disc < 0:
+            # not moving relative to each other, moving apart, or passing wide
+            return None
+        t = (-b - math.sqrt(disc)) / (2 * a)
+        return t if t <= 1 else None
+
+    def collide_at(self, ref, toi, dt):
+        '''bounce off ref at the time of impact: back both circles up to where they touched,
+        reflect, then spend the rest of the step moving with the new velocities'''
+        if toi > 0:
+            self._pos = self._prev_pos.lerp(self._pos, toi)
+            ref._pos = ref._prev_pos.lerp(ref._pos, toi)
+        self.reflect_obj(ref, dt)
+        if toi > 0:
+            self._pos += self._vel * (1 - toi) * dt
+            ref._pos += ref._vel * (1 - toi) * dt
+
+    def wall_penetration(self, ref):
+        '''how far the circle reaches past the inner face of an axis aligned wall, along its normal'''
+        norm = ref._norm_vect
+        face = Vector2.dot(norm, ref._pos) + (abs(norm.x) * ref._width + abs(norm.y) * ref._height) / 2
+        return face - (Vector2.dot(norm, self._pos) - self._radius)
+
+    def is_colliding_wall(self, ref):
+        return self.wall_penetration(ref) > 0
+
     def reflect_wall(self, ref, dt):
-        # walls using their norm vect
-        self._pos = ref._
-        self._vel = self._vel.reflect(ref._norm_vect)
+        # walls using their norm vect, push back out and only bounce if still heading in
+        depth = self.wall_penetration(ref)
+        if depth > 0:
+            self._pos += ref._norm_vect * depth
+        if Vector2.dot(self._vel, ref._norm_vect) < 0:
+            self._vel = self._vel.reflect(ref._norm_vect)
         #self._acc = self._acc.reflect(ref._norm_vect)
         
     def elastic_collide(p1, p2, v1, v2, m1, m2):
@@ -55,6 +103,25 @@ class Circle(Sprite):
         dist = math.sqrt(math.pow(ref._pos.x - self._pos.x, 2) + math.pow(ref._pos.y - self._pos.y, 2))
         return dist < (self._radius + ref._radius)
         
+    def raycast(self, origin: Vector2, direction: Vector2, max_t: float):
+        '''smallest t in [0, max_t] where origin + t * direction touches the circle, or None'''
+        to_origin = origin - self._pos
+        a = direction.dot(direction)
+        b = 2 * direction.dot(to_origin)
+        c = to_origin.dot(to_origin) - self._radius * self._radius
+        if c <= 0:
+            # starts inside
+            return 0
+        disc = b * b - 4 * a * c
+        if a == 0 or disc < 0:
+            return None
+        t = (-b - math.sqrt(disc)) / (2 * a)
+        return t if 0 <= t <= max_t else None
+        
+    def distance_to_point(self, point: Vector2) -> float:
+        '''distance from point to the edge of the circle, 0 if the point is inside'''
+        return max(0, self._pos.distance_to(point) - self._radius)
+
     def reflect_obj(self, ref, dt):
         # work in progress for "nudging" -- need to change circle collision first
         # let's try nudging based on the angle they currently are
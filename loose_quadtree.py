@@ -0,0 +1,181 @@
+import pygame
+import math
+from typing import Dict, List, Tuple
+from pygame.math import Vector2
+from pygame.rect import Rect
+
+from aabb import AABB
+
+class LooseQuadtree(object):
+    '''loose quadtree over a fixed world rect with the proxy / query / all pairs surface of AABBTree.
+
+    Level L splits the world into 2^L x 2^L cells, and every cell's loose bounds are
+    the cell grown by half a cell on each side. A box no bigger than a level L cell
+    whose center sits in a cell always fits that cell's loose bounds, so level and
+    cell come straight from the box's size and center, no descent. Cells are kept in
+    one dict per level, and a move that keeps the same level and cell only overwrites
+    the stored box. Boxes whose center is off the world go in the root cell, which
+    every query visits.
+    '''
+    _bounds: List[List[float]]   # handle -> [min x, min y, max x, max y]
+    _indx: List[int]
+    _level: List[int]            # handle -> level, -1 for free handles
+    _cell: List[Tuple[int, int]]  # handle -> cell on its level
+    _cells: List[Dict[Tuple[int, int], List[int]]]  # level -> cell -> handles
+    _free: List[int]
+
+    def __init__(self, width: float = 1280, height: float = 720, max_depth: int = 7):
+        self._width = width
+        self._height = height
+        self._max_depth = max_depth
+        self._bounds = []
+        self._indx = []
+        self._level = []
+        self._cell = []
+        self._cells = [{} for _ in range(max_depth + 1)]
+        self._free = []
+        # boxes tested by the last query / query_all_pairs
+        self._num_checks = 0
+
+    def cell_size(self, level: int) -> Tuple[float, float]:
+        return self._width / 2 ** level, self._height / 2 ** level
+
+    def locate(self, min_x: float, min_y: float, max_x: float, max_y: float) -> Tuple[int, Tuple[int, int]]:
+        '''level and cell of a box in O(1): the deepest level whose cells are at least as big as it'''
+        box_w = max_x - min_x
+        box_h = max_y - min_y
+        if box_w <= 0 and box_h <= 0:
+            level = self._max_depth
+        else:
+            fits = min(self._width / box_w if box_w > 0 else math.inf, self._height / box_h if box_h > 0 else math.inf)
+            level = 0 if fits < 1 else min(int(math.log2(fits)), self._max_depth)
+
+        center_x = (min_x + max_x) / 2
+        center_y = (min_y + max_y) / 2
+        if not (0 <= center_x < self._width and 0 <= center_y < self._height):
+            return 0, (0, 0)
+        cell_w, cell_h = self.cell_size(level)
+        # clamp against float round off right at the far edges
+        last = 2 ** level - 1
+        return level, (min(int(center_x / cell_w), last), min(int(center_y / cell_h), last))
+
+    def create_proxy(self, aabb: AABB, user_data: int) -> int:
+        if len(self._free) > 0:
+            handle = self._free.pop()
+            self._indx[handle] = user_data
+        else:
+            handle = len(self._indx)
+            self._indx.append(user_data)
+            self._bounds.append(None)
+            self._level.append(-1)
+            self._cell.append(None)
+
+        self._bounds[handle] = [aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y]
+        level, cell = self.locate(*self._bounds[handle])
+        self._level[handle] = level
+        self._cell[handle] = cell
+        self._cells[level].setdefault(cell, []).append(handle)
+        return handle
+
+    def unlink(self, handle: int):
+        cell_list = self._cells[self._level[handle]][self._cell[handle]]
+        cell_list.remove(handle)
+        if len(cell_list) == 0:
+            del self._cells[self._level[handle]][self._cell[handle]]
+
+    def destroy_proxy(self, handle: int):
+        self.unlink(handle)
+        self._level[handle] = -1
+        self._indx[handle] = -1
+        self._free.append(handle)
+
+    def get_indx(self, handle: int) -> int:
+        return self._indx[handle]
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return AABB(*self._bounds[handle])
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''in place if the box keeps its level and cell, otherwise relinks it. returns True if it
+        changed cells. displacement is ignored, the loose bounds are the slack'''
+        self._bounds[handle] = [new_aabb._min_x, new_aabb._min_y, new_aabb._max_x, new_aabb._max_y]
+        level, cell = self.locate(*self._bounds[handle])
+        if level == self._level[handle] and cell == self._cell[handle]:
+            return False
+        self.unlink(handle)
+        self._level[handle] = level
+        self._cell[handle] = cell
+        self._cells[level].setdefault(cell, []).append(handle)
+        return True
+
+    def cells_touching(self, level: int, min_x: float, min_y: float, max_x: float, max_y: float):
+        '''yields the handle lists of the occupied level cells whose loose bounds overlap the box'''
+        cells = self._cells[level]
+        if level == 0:
+            # the root also holds everything that is off the world
+            if (0, 0) in cells:
+                yield cells[(0, 0)]
+            return
+
+        cell_w, cell_h = self.cell_size(level)
+        last = 2 ** level - 1
+        lo_x = max(int(math.floor((min_x - cell_w / 2) / cell_w)), 0)
+        hi_x = min(int(math.floor((max_x + cell_w / 2) / cell_w)), last)
+        lo_y = max(int(math.floor((min_y - cell_h / 2) / cell_h)), 0)
+        hi_y = min(int(math.floor((max_y + cell_h / 2) / cell_h)), last)
+        if lo_x > hi_x or lo_y > hi_y:
+            return
+        if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(cells):
+            # big query on a sparse level, walking the occupied cells is cheaper
+            for (cell_x, cell_y), handles in cells.items():
+                if lo_x <= cell_x <= hi_x and lo_y <= cell_y <= hi_y:
+                    yield handles
+            return
+        for cell_x in range(lo_x, hi_x + 1):
+            for cell_y in range(lo_y, hi_y + 1):
+                handles = cells.get((cell_x, cell_y))
+                if handles is not None:
+                    yield handles
+
+    def overlapping(self, min_x: float, min_y: float, max_x: float, max_y: float, levels):
+        bounds = self._bounds
+        for level in levels:
+            for handles in self.cells_touching(level, min_x, min_y, max_x, max_y):
+                for handle in handles:
+                    self._num_checks += 1
+                    b_min_x, b_min_y, b_max_x, b_max_y = bounds[handle]
+                    if not (max_x < b_min_x or min_x > b_max_x or max_y < b_min_y or min_y > b_max_y):
+                        yield handle
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every proxy whose box overlaps aabb'''
+        self._num_checks = 0
+        occupied = [level for level in range(self._max_depth + 1) if len(self._cells[level]) > 0]
+        for handle in self.overlapping(aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y, occupied):
+            yield self._indx[handle]
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) once for every pair of proxies whose boxes overlap. every box looks
+        up its own level and the coarser ones, same level pairs are kept from the smaller handle'''
+        self._num_checks = 0
+        occupied = [level for level in range(self._max_depth + 1) if len(self._cells[level]) > 0]
+        for position, level in enumerate(occupied):
+            coarser = occupied[:position]
+            for handles in list(self._cells[level].values()):
+                for handle in handles:
+                    box = self._bounds[handle]
+                    for other in self.overlapping(*box, [level]):
+                        if other > handle:
+                            yield (self._indx[handle], self._indx[other])
+                    for other in self.overlapping(*box, coarser):
+                        yield (self._indx[handle], self._indx[other])
+
+    def render_tree(self, screen, color):
+        '''outlines the occupied cells (not their loose bounds) and the proxy boxes'''
+        for level, cells in enumerate(self._cells):
+            cell_w, cell_h = self.cell_size(level)
+            for cell_x, cell_y in cells:
+                pygame.draw.rect(screen, color, Rect(cell_x * cell_w, cell_y * cell_h, cell_w, cell_h), 1)
+        for handle, (min_x, min_y, max_x, max_y) in enumerate(self._bounds):
+            if self._level[handle] >= 0:
+                pygame.draw.rect(screen, pygame.Color(0, 255, 0), Rect(min_x, min_y, max_x - min_x, max_y - min_y), 1)
@@ -0,0 +1,95 @@
+from typing import Dict, List, NamedTuple, Set, Tuple
+from pygame.math import Vector2
+
+from aabb import AABB, AABBTree
+
+class ContactEvents(NamedTuple):
+    begin: List[Tuple[int, int]]    # pairs that started overlapping this update
+    persist: List[Tuple[int, int]]  # pairs that were already overlapping and still are
+    end: List[Tuple[int, int]]      # pairs that stopped overlapping (or lost a proxy)
+
+class PairManager(object):
+    '''keeps the overlapping leaf pairs of an AABBTree alive between frames.
+
+    A pair can only change when one of its leaves gets a new fat box, i.e. when
+    move_proxy had to reinsert it, so update_pairs only requeries those leaves and
+    diffs their partners against the cached ones. Pairs are (smaller indx, larger indx).
+
+    Static geometry (walls and the like) lives in a tree the caller builds once with tight
+    boxes and never refits, static_pairs finds what the dynamic leaves touch with one tree vs
+    tree descent. Static indices are that tree's own numbering.
+    '''
+    _tree: AABBTree
+    _handles: Dict[int, int]
+    _pairs: Set[Tuple[int, int]]
+    _partners: Dict[int, Set[int]]
+    _moved: Set[int]
+
+    def __init__(self, tree: AABBTree):
+        self._tree = tree
+        # indx -> proxy handle in the dynamic tree
+        self._handles = {}
+        self._pairs = set()
+        self._partners = {}
+        self._moved = set()
+        self._ended = []
+        # tree nodes visited by the last update_pairs
+        self._num_checks = 0
+
+    def add_proxy(self, indx: int, aabb: AABB):
+        self._handles[indx] = self._tree.create_proxy(aabb, indx)
+        self._partners[indx] = set()
+        self._moved.add(indx)
+
+    def remove_proxy(self, indx: int):
+        self._tree.destroy_proxy(self._handles.pop(indx))
+        for other in self._partners.pop(indx):
+            self._partners[other].discard(indx)
+            pair = (min(indx, other), max(indx, other))
+            self._pairs.discard(pair)
+            self._ended.append(pair)
+        self._moved.discard(indx)
+
+    def move_proxy(self, indx: int, aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''forwards to AABBTree.move_proxy and remembers the leaf if it got a new fat box'''
+        if self._tree.move_proxy(self._handles[indx], aabb, displacement):
+            self._moved.add(indx)
+            return True
+        return False
+
+    def update_pairs(self) -> ContactEvents:
+        begin = []
+        end = self._ended
+        self._ended = []
+        self._num_checks = 0
+
+        for indx in self._moved:
+            found = set(self._tree.query(self._tree.get_fat_aabb(self._handles[indx])))
+            self._num_checks += self._tree._num_checks
+            found.discard(indx)
+            partners = self._partners[indx]
+
+            for other in found - partners:
+                pair = (min(indx, other), max(indx, other))
+                self._pairs.add(pair)
+                partners.add(other)
+                self._partners[other].add(indx)
+                begin.append(pair)
+
+            for other in partners - found:
+                pair = (min(indx, other), max(indx, other))
+                self._pairs.discard(pair)
+                partners.discard(other)
+                self._partners[other].discard(indx)
+                end.append(pair)
+        self._moved.clear()
+
+        began = set(begin)
+        persist = [pair for pair in self._pairs if pair not in began]
+        return ContactEvents(begin, persist, end)
+
+    def static_pairs(self, static_tree):
+        '''yields (dynamic indx, static indx) for every dynamic fat box touching a leaf of
+        static_tree, an AABBTree or AABBArrayTree'''
+        yield from self._tree.query_tree(static_tree)
+        self._num_checks += self._tree._num_checks
@@ -0,0 +1,226 @@
+import pygame
+import numpy as np
+from typing import List
+import random
+import argparse
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from circle import Circle
+from wall import boundary_walls
+from aabb import AABB
+from aabb_array import AABBArrayTree
+from aabb_build import BUILDERS, build_parallel
+from spatial_hash import HierarchicalGrid, SpatialHashGrid
+from sweep_and_prune import SweepAndPrune
+from loose_quadtree import LooseQuadtree
+from broadphase import (Broadphase, BruteForceBroadphase, EscapeBroadphase, PairManagerBroadphase, ProxyBroadphase,
+                        RebuildBroadphase, RefitBroadphase, ReinsertBroadphase)
+
+SCREEN_WIDTH = 1280
+SCREEN_HEIGHT = 720
+
+def main(argv: List[str] = None):
+    '''one runner for every broadphase, the per-structure scripts call this with their --broadphase'''
+    parser = argparse.ArgumentParser()
+    parser.add_argument("num_spawn", help="num circles to spawn on map", type=int)
+    parser.add_argument("min_radius", help="minimum radius of circles", type=int)
+    parser.add_argument("max_radius", help="maximum radius of circles", type=int)
+    parser.add_argument("spacing", help="spacing of circles", type=int)
+    parser.add_argument("--broadphase", help="how circle pairs are found, everything else about the run is the same", choices=["brute", "rebuild", "refit", "escape", "reinsert", "pairs", "array", "grid", "hgrid", "sap", "quadtree"], default="reinsert")
+    parser.add_argument("--builder", help="bulk builder for --broadphase rebuild and refit", choices=list(BUILDERS), default="sah")
+    parser.add_argument("--workers", help="build subtrees in this many processes (needs fork, 0 builds in this process)", type=int, default=0)
+    parser.add_argument("--rebuild_ratio", help="--broadphase refit rebuilds once the SAH cost passes this times the last build's", type=float, default=1.5)
+    parser.add_argument("--optimize_ms", help="time per frame --broadphase reinsert and pairs spend in AABBTree.optimize", type=float, default=0)
+    parser.add_argument("--swept", help="boxes cover the whole step and pairs use time of impact, so fast circles can't tunnel", action="store_true")
+    args = parser.parse_args(argv)
+
+    builder = BUILDERS[args.builder]
+    if args.workers > 0:
+        # forked so the workers don't rerun the script, the pool lives as long as the run
+        pool = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("fork"))
+        builder = functools.partial(build_parallel, executor=pool, builder=builder, num_tasks=args.workers)
+    num_spawn = int(args.num_spawn)
+    min_radius = int(args.min_radius)
+    max_radius = int(args.max_radius)
+    spacing = int(args.spacing)
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT)) # flags=pygame.NOFRAME
+    pygame.display.set_caption('Broadphase: ' + args.broadphase)
+    clock = pygame.time.Clock()
+    running = True
+    paused = False
+
+    # fps counter
+    font = pygame.font.SysFont("dejavusansmono", 18)
+    def render_text(text: str):
+        return font.render(text, 1, pygame.Color("coral"))
+
+    # circle spawning
+    # calculate number that we can spawn with the radius + spacing
+    num_width = int(SCREEN_WIDTH / (max_radius * 2 + spacing))
+    num_height = int(SCREEN_HEIGHT / (max_radius * 2 + spacing))
+    if(num_spawn > num_width * num_height):
+        print("too many circles, not enough room!")
+        return
+
+    # spawn circles
+    circles: List[Circle] = []
+    curr_x = spacing
+    curr_y = spacing
+    for i in range(num_height):
+        curr_y += max_radius
+
+        for j in range(num_width):
+            if i * num_width + j >= num_spawn:
+                break
+
+            curr_x += max_radius
+            curr_circle = Circle((curr_x, curr_y),
+                                (random.randint(-100, 100), random.randint(-100, 100)),
+                                (0, 0),# (random.randint(-20, 20), random.randint(-20, 20)),
+                                random.randint(min_radius, max_radius),  # can experiment with random radius -- random.randint(1, radius)
+                                random.choice(["green", "blue", "yellow", "red", "grey"]))
+            circles.append(curr_circle)
+            curr_x += max_radius + spacing
+
+        # reset pos
+        curr_x = spacing
+        curr_y += max_radius + spacing
+
+    def circle_box(circle: Circle) -> AABB:
+        return AABB(*circle.swept_bounds()) if args.swept else AABB.from_rect(circle.rect)
+
+    broadphases = {
+        "brute": lambda: BruteForceBroadphase(),
+        "rebuild": lambda: RebuildBroadphase(builder),
+        "refit": lambda: RefitBroadphase(builder, args.rebuild_ratio),
+        "escape": lambda: EscapeBroadphase(),
+        "reinsert": lambda: ReinsertBroadphase(args.optimize_ms),
+        "pairs": lambda: PairManagerBroadphase(args.optimize_ms),
+        "array": lambda: ProxyBroadphase(AABBArrayTree()),
+        "grid": lambda: ProxyBroadphase(SpatialHashGrid(max_radius)),
+        "hgrid": lambda: ProxyBroadphase(HierarchicalGrid(min_radius, max_radius)),
+        "sap": lambda: ProxyBroadphase(SweepAndPrune()),
+        "quadtree": lambda: ProxyBroadphase(LooseQuadtree(SCREEN_WIDTH, SCREEN_HEIGHT)),
+    }
+    broadphase: Broadphase = broadphases[args.broadphase]()
+    for i, circle in enumerate(circles):
+        broadphase.add(i, circle_box(circle))
+    
+    # walls never move, so they get their own tree built once. their boxes are the half spaces
+    # behind them, a circle that gets carried far past an edge still finds its wall
+    walls = boundary_walls(SCREEN_WIDTH, SCREEN_HEIGHT)
+    static_tree = AABBArrayTree(margin=0)
+    static_tree.build_from_boxes(np.array([wall.half_space_bounds() for wall in walls]))
+
+    total_time = 0
+    num_checks = 0
+    total_frames = 0
+    frames_checks = 0
+    reinsertions = 0
+    avg_frames_render = None
+    avg_checks_render = None
+    avg_reinserts_render = None
+    stats_renders = []
+
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_q:
+                    running = False
+                if event.key == pygame.K_p:
+                    paused = not paused
+
+        # convert dt to seconds by dividing by 1000
+        dt = clock.tick() / 1000
+            
+        screen.fill("#000000")
+    
+        if paused:
+            continue
+
+        for i, circle in enumerate(circles):
+            circle.on_tick(dt)
+            if broadphase.move(i, circle_box(circle), circle._vel * dt):
+                reinsertions += 1
+
+        # the only part that changes between runs
+        swept_hits = set()
+        for i, j in broadphase.pairs():
+            if args.swept:
+                toi = circles[i].time_of_impact(circles[j])
+                if toi is not None:
+                    circles[i].collide_at(circles[j], toi, dt)
+                    swept_hits.update((i, j))
+            elif circles[i].is_colliding_circle(circles[j]):
+                circles[i].reflect_obj(circles[j], dt)
+        num_checks += broadphase._num_checks
+    
+        # walls are the same static tree for every broadphase, tree backed ones descend it
+        # against their own tree and the rest query it once per circle
+        for i, w in broadphase.static_pairs(static_tree):
+            if circles[i].is_colliding_wall(walls[w]):
+                circles[i].reflect_wall(walls[w], dt)
+        num_checks += broadphase._num_checks
+
+        # collide_at carries circles on past the boxes the broadphase saw, those few ask again
+        for i in swept_hits:
+            for w in static_tree.query(circle_box(circles[i])):
+                if circles[i].is_colliding_wall(walls[w]):
+                    circles[i].reflect_wall(walls[w], dt)
+            num_checks += static_tree._num_checks
+
+        for circle in circles:
+            circle.render(screen)
+    
+        broadphase.render(screen, pygame.Color(255, 0, 0))
+
+        curr_fps = clock.get_fps()
+        total_time += dt
+        total_frames += curr_fps
+        frames_checks += 1
+        # avg fps and checks every 1s
+        if total_time >= 1:
+            avg_framerate = total_frames / frames_checks
+            avg_checks = num_checks / frames_checks
+            reinsertions /= frames_checks
+        
+            avg_check_str = "{:<12}{:10.1f}".format("Avg Checks:", avg_checks)
+            avg_frames_str = "{:<12}{:10.1f}".format("Avg FPS:", avg_framerate)
+            avg_reinserts_str = "{:<12}{:9.1f}".format("Reinsertions:", reinsertions)
+            avg_checks_render = render_text(avg_check_str)
+            avg_frames_render = render_text(avg_frames_str)
+            avg_reinserts_render = render_text(avg_reinserts_str)
+            stats_renders = [render_text("{:<12}{:>10}".format(label, value)) for label, value in broadphase.stats()]
+
+            total_time = 0
+            total_frames = 0
+            frames_checks = 0
+            num_checks = 0
+            reinsertions = 0
+
+        # fps rect
+        s = pygame.Surface((250, 90 + 20 * len(stats_renders)), pygame.SRCALPHA)
+        s.fill((0, 0, 0, 128))
+        screen.blit(s, (0, 0))
+        fps_text = "{:<12}{:10d}".format("Cur FPS:", int(curr_fps))
+        screen.blit(render_text(fps_text), (5, 10))
+        if avg_frames_render:
+            screen.blit(avg_frames_render, (5, 30))
+        if avg_checks_render:
+            screen.blit(avg_checks_render, (5, 50))
+        if avg_reinserts_render:
+            screen.blit(avg_reinserts_render, (5, 70))
+        for k, stats_render in enumerate(stats_renders):
+            screen.blit(stats_render, (5, 90 + 20 * k))
+        pygame.display.flip()
+    
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
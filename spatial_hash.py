@@ -0,0 +1,311 @@
+import pygame
+import math
+import numpy as np
+from typing import List
+from pygame.math import Vector2
+from pygame.rect import Rect
+
+from aabb import AABB
+
+# cell coordinates are shifted by this before packing x and y into one 64 bit key
+CELL_OFFSET = 1 << 31
+
+class SpatialHashGrid(object):
+    '''uniform grid broadphase with the same proxy / query / all pairs surface as AABBTree.
+
+    Proxies are slots in flat arrays, a move just overwrites the slot's box. The
+    buckets are rebuilt from scratch (only when something changed) with numpy: every
+    box is expanded into the cells it touches, the (cell key, slot) entries are sorted
+    by key, and entries sharing a cell end up in one run. Pairs come from comparing
+    each run against itself, and a pair is only reported by the cell holding the
+    corner where the two boxes start overlapping, so it comes out once.
+    '''
+    _cell_size: float
+    _bounds: np.ndarray  # (capacity, 4) -> min x, min y, max x, max y
+    _indx: np.ndarray    # proxy payload
+    _alive: np.ndarray   # False for free slots
+    _free: List[int]
+    _keys: np.ndarray     # sorted cell key of every entry
+    _entries: np.ndarray  # slot of every entry, in key order
+    _cells: np.ndarray    # (num_entries, 2) cell x, y of every entry, in key order
+
+    def __init__(self, max_radius: float, capacity: int = 16):
+        # a circle is at most one cell wide, so it touches at most 2x2 cells
+        self._cell_size = 2 * max_radius
+        self._bounds = np.zeros((capacity, 4), dtype=np.float64)
+        self._indx = np.full(capacity, -1, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._dirty = True
+        self._keys = np.zeros(0, dtype=np.uint64)
+        self._entries = np.zeros(0, dtype=np.int64)
+        self._cells = np.zeros((0, 2), dtype=np.int64)
+        # entries (or entry pairs) tested by the last query / query_all_pairs
+        self._num_checks = 0
+
+    @staticmethod
+    def _resized(array: np.ndarray, capacity: int, fill) -> np.ndarray:
+        new_array = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+        new_array[:len(array)] = array
+        return new_array
+
+    def _allocate_slot(self) -> int:
+        if len(self._free) == 0:
+            old = len(self._alive)
+            self._bounds = self._resized(self._bounds, 2 * old, 0)
+            self._indx = self._resized(self._indx, 2 * old, -1)
+            self._alive = self._resized(self._alive, 2 * old, False)
+            self._free = list(range(2 * old - 1, old - 1, -1))
+        return self._free.pop()
+
+    def create_proxy(self, aabb: AABB, user_data: int) -> int:
+        slot = self._allocate_slot()
+        self._bounds[slot] = (aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y)
+        self._indx[slot] = user_data
+        self._alive[slot] = True
+        self._dirty = True
+        return slot
+
+    def destroy_proxy(self, handle: int):
+        self._alive[handle] = False
+        self._indx[handle] = -1
+        self._free.append(handle)
+        self._dirty = True
+
+    def get_indx(self, handle: int) -> int:
+        return int(self._indx[handle])
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return AABB(*self._bounds[handle].tolist())
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''overwrites the proxy's box (no fattening, the grid is rebuilt anyway). returns True
+        if the box now covers a different set of cells. displacement is ignored'''
+        x0, y0, x1, y1 = self._bounds[handle].tolist()
+        self._bounds[handle] = (new_aabb._min_x, new_aabb._min_y, new_aabb._max_x, new_aabb._max_y)
+        self._dirty = True
+        size = self._cell_size
+        return (x0 // size != new_aabb._min_x // size or y0 // size != new_aabb._min_y // size
+                or x1 // size != new_aabb._max_x // size or y1 // size != new_aabb._max_y // size)
+
+    def cell_range(self, bounds: np.ndarray):
+        lo = np.floor(bounds[:, :2] / self._cell_size).astype(np.int64)
+        hi = np.floor(bounds[:, 2:] / self._cell_size).astype(np.int64)
+        return lo, hi
+
+    @staticmethod
+    def cell_key(cells_x: np.ndarray, cells_y: np.ndarray) -> np.ndarray:
+        return ((cells_x + CELL_OFFSET).astype(np.uint64) << np.uint64(32)) | (cells_y + CELL_OFFSET).astype(np.uint64)
+
+    def expand_cells(self, bounds: np.ndarray):
+        '''one entry per (box, cell touched): returns the box row, cell x and cell y of every entry'''
+        lo, hi = self.cell_range(bounds)
+        span = hi - lo + 1
+        counts = span[:, 0] * span[:, 1]
+
+        # entry k of a box covers cell lo + (k % width, k // width)
+        owner = np.repeat(np.arange(len(bounds)), counts)
+        k = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = span[owner, 0]
+        return owner, lo[owner, 0] + k % width, lo[owner, 1] + k // width
+
+    def rebuild(self):
+        '''O(N) bucketing plus the sort: one entry per (slot, cell touched), sorted by cell key'''
+        slots = np.nonzero(self._alive)[0]
+        owner, cells_x, cells_y = self.expand_cells(self._bounds[slots])
+
+        keys = self.cell_key(cells_x, cells_y)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._entries = slots[owner[order]]
+        self._cells = np.stack((cells_x[order], cells_y[order]), axis=1)
+        self._dirty = False
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every proxy whose box overlaps aabb'''
+        if self._dirty:
+            self.rebuild()
+
+        query_box = np.array([[aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y]])
+        lo, hi = self.cell_range(query_box)
+        cells_x, cells_y = np.meshgrid(np.arange(lo[0, 0], hi[0, 0] + 1), np.arange(lo[0, 1], hi[0, 1] + 1))
+        keys = self.cell_key(cells_x.ravel(), cells_y.ravel())
+        starts = np.searchsorted(self._keys, keys, side="left")
+        ends = np.searchsorted(self._keys, keys, side="right")
+        found = np.unique(np.concatenate([self._entries[s:e] for s, e in zip(starts, ends)] + [np.zeros(0, dtype=np.int64)]))
+        self._num_checks = len(found)
+
+        b = self._bounds[found]
+        hit = ~((b[:, 2] < aabb._min_x) | (b[:, 0] > aabb._max_x) | (b[:, 3] < aabb._min_y) | (b[:, 1] > aabb._max_y))
+        yield from self._indx[found[hit]].tolist()
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) once for every pair of proxies whose boxes overlap'''
+        if self._dirty:
+            self.rebuild()
+
+        # entries of one cell are contiguous, so entry p pairs with p + gap while the keys match
+        first = []
+        second = []
+        gap = 1
+        while gap < len(self._keys):
+            same = np.nonzero(self._keys[gap:] == self._keys[:-gap])[0]
+            if len(same) == 0:
+                break
+            first.append(same)
+            second.append(same + gap)
+            gap += 1
+        if len(first) == 0:
+            self._num_checks = 0
+            return
+
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+        self._num_checks = len(first)
+        a = self._bounds[self._entries[first]]
+        b = self._bounds[self._entries[second]]
+        overlap = ~((a[:, 2] < b[:, 0]) | (a[:, 0] > b[:, 2]) | (a[:, 3] < b[:, 1]) | (a[:, 1] > b[:, 3]))
+
+        # only the cell holding the max of the two min corners reports the pair
+        corner = np.floor(np.maximum(a[:, :2], b[:, :2]) / self._cell_size).astype(np.int64)
+        report = overlap & (corner == self._cells[first]).all(axis=1)
+        yield from zip(self._indx[self._entries[first[report]]].tolist(), self._indx[self._entries[second[report]]].tolist())
+
+    def query_boxes(self, boxes: np.ndarray):
+        '''batched query: returns (rows, indx) arrays with one entry for every (box, proxy) overlap.
+        uses the same corner rule as query_all_pairs, so boxes spanning several cells don't repeat'''
+        if self._dirty:
+            self.rebuild()
+
+        owner, cells_x, cells_y = self.expand_cells(boxes)
+        keys = self.cell_key(cells_x, cells_y)
+        starts = np.searchsorted(self._keys, keys, side="left")
+        counts = np.searchsorted(self._keys, keys, side="right") - starts
+
+        # every query entry against every grid entry in the same cell
+        first = np.repeat(np.arange(len(keys)), counts)
+        second = np.repeat(starts, counts) + np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        self._num_checks = len(first)
+        a = boxes[owner[first]]
+        b = self._bounds[self._entries[second]]
+        overlap = ~((a[:, 2] < b[:, 0]) | (a[:, 0] > b[:, 2]) | (a[:, 3] < b[:, 1]) | (a[:, 1] > b[:, 3]))
+        corner = np.floor(np.maximum(a[:, :2], b[:, :2]) / self._cell_size).astype(np.int64)
+        report = overlap & (corner[:, 0] == cells_x[first]) & (corner[:, 1] == cells_y[first])
+        return owner[first[report]], self._indx[self._entries[second[report]]]
+
+    def render_tree(self, screen, color):
+        '''outlines the occupied cells and the proxy boxes'''
+        if self._dirty:
+            self.rebuild()
+
+        size = self._cell_size
+        for x, y in np.unique(self._cells, axis=0).tolist():
+            pygame.draw.rect(screen, color, Rect(x * size, y * size, size, size), 1)
+        for x0, y0, x1, y1 in self._bounds[self._alive].tolist():
+            pygame.draw.rect(screen, pygame.Color(0, 255, 0), Rect(x0, y0, x1 - x0, y1 - y0), 1)
+
+class HierarchicalGrid(object):
+    '''stack of SpatialHashGrids whose cell sizes double from 2 * min_radius up to 2 * max_radius.
+
+    Each proxy lives on the finest level whose cells are at least as big as its box, so
+    every box touches at most 2x2 cells on its own level no matter how mixed the radii
+    are. Pairs within a level come from that level's query_all_pairs. For pairs across
+    levels, the boxes on each level are batch queried against every coarser level that
+    has proxies (query_boxes), so small vs small never pays for the big cells and big
+    vs big never walks the small ones.
+    '''
+    _levels: List[SpatialHashGrid]
+    _level_of: List[int]   # handle -> level, -1 for free handles
+    _level_handle: List[int]  # handle -> handle inside its level
+    _indx: List[int]
+    _free: List[int]
+
+    def __init__(self, min_radius: float, max_radius: float):
+        # min_radius 0 would make every level 0 wide and the loop below never end
+        self._base_size = max(2 * min_radius, 1)
+        num_levels = 1
+        while self._base_size * 2 ** (num_levels - 1) < 2 * max_radius:
+            num_levels += 1
+        self._levels = [SpatialHashGrid(self._base_size * 2 ** level / 2) for level in range(num_levels)]
+        self._level_of = []
+        self._level_handle = []
+        self._indx = []
+        self._free = []
+        self._num_checks = 0
+
+    def level_for(self, min_x: float, min_y: float, max_x: float, max_y: float) -> int:
+        extent = max(max_x - min_x, max_y - min_y)
+        if extent <= self._base_size:
+            return 0
+        return min(int(math.ceil(math.log2(extent / self._base_size))), len(self._levels) - 1)
+
+    def create_proxy(self, aabb: AABB, user_data: int) -> int:
+        if len(self._free) > 0:
+            handle = self._free.pop()
+            self._indx[handle] = user_data
+        else:
+            handle = len(self._indx)
+            self._indx.append(user_data)
+            self._level_of.append(-1)
+            self._level_handle.append(-1)
+        level = self.level_for(aabb._min_x, aabb._min_y, aabb._max_x, aabb._max_y)
+        self._level_of[handle] = level
+        # the level grids carry our handle as their payload
+        self._level_handle[handle] = self._levels[level].create_proxy(aabb, handle)
+        return handle
+
+    def destroy_proxy(self, handle: int):
+        self._levels[self._level_of[handle]].destroy_proxy(self._level_handle[handle])
+        self._level_of[handle] = -1
+        self._indx[handle] = -1
+        self._free.append(handle)
+
+    def get_indx(self, handle: int) -> int:
+        return self._indx[handle]
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return self._levels[self._level_of[handle]].get_fat_aabb(self._level_handle[handle])
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''moves the proxy inside its level, or over to another level if its size changed enough.
+        returns True if it now covers different cells'''
+        level = self.level_for(new_aabb._min_x, new_aabb._min_y, new_aabb._max_x, new_aabb._max_y)
+        if level == self._level_of[handle]:
+            return self._levels[level].move_proxy(self._level_handle[handle], new_aabb, displacement)
+        self._levels[self._level_of[handle]].destroy_proxy(self._level_handle[handle])
+        self._level_of[handle] = level
+        self._level_handle[handle] = self._levels[level].create_proxy(new_aabb, handle)
+        return True
+
+    def occupied_levels(self) -> List[SpatialHashGrid]:
+        return [grid for grid in self._levels if grid._alive.any()]
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every proxy whose box overlaps aabb'''
+        self._num_checks = 0
+        for grid in self.occupied_levels():
+            for handle in grid.query(aabb):
+                yield self._indx[handle]
+            self._num_checks += grid._num_checks
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) once for every pair of proxies whose boxes overlap'''
+        self._num_checks = 0
+        levels = self.occupied_levels()
+        for position, grid in enumerate(levels):
+            for a, b in grid.query_all_pairs():
+                yield (self._indx[a], self._indx[b])
+            self._num_checks += grid._num_checks
+
+            # this level's boxes only go up, the coarser levels handle their own pairs
+            slots = np.nonzero(grid._alive)[0]
+            boxes = grid._bounds[slots]
+            for coarser in levels[position + 1:]:
+                rows, handles = coarser.query_boxes(boxes)
+                self._num_checks += coarser._num_checks
+                for a, b in zip(grid._indx[slots[rows]].tolist(), handles.tolist()):
+                    yield (self._indx[a], self._indx[b])
+
+    def render_tree(self, screen, color):
+        for grid in self.occupied_levels():
+            grid.render_tree(screen, color)
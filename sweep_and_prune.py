@@ -0,0 +1,203 @@
+import pygame
+import math
+from typing import List, Set, Tuple
+from pygame.math import Vector2
+from pygame.rect import Rect
+
+from aabb import AABB
+
+class SweepAndPrune(object):
+    '''incremental sort and sweep broadphase with the proxy / query / all pairs surface of AABBTree.
+
+    Each axis keeps one sorted list of interval endpoints. A move changes the proxy's
+    endpoint values in place and insertion sorts them back into position, which is
+    close to O(1) per proxy when things only move a few pixels a frame. Overlapping
+    pairs are kept in a set that only changes when a min endpoint crosses a max
+    endpoint: crossing into the other interval can start an overlap, crossing out of
+    it ends one. Equal values sort mins before maxes, so touching boxes overlap like
+    they do in AABB.overlaps.
+    '''
+    _bounds: List[List[float]]   # handle -> [min x, min y, max x, max y]
+    _indx: List[int]
+    _values: List[List[float]]   # axis -> endpoint values in sorted order
+    _owners: List[List[int]]     # axis -> handle of every endpoint
+    _is_max: List[List[int]]     # axis -> 0 for a min endpoint, 1 for a max
+    _where: List[List[int]]      # axis -> position of endpoint 2 * handle + is_max
+    _pairs: Set[Tuple[int, int]] # (smaller handle, larger handle)
+    _free: List[int]
+
+    def __init__(self):
+        self._bounds = []
+        self._indx = []
+        self._values = [[], []]
+        self._owners = [[], []]
+        self._is_max = [[], []]
+        self._where = [[], []]
+        self._pairs = set()
+        self._free = []
+        # min / max endpoint swaps since the last query_all_pairs
+        self._swaps = 0
+        # swaps plus pairs handed out by the last query_all_pairs, or boxes tested by the last query
+        self._num_checks = 0
+
+    def create_proxy(self, aabb: AABB, user_data: int) -> int:
+        if len(self._free) > 0:
+            handle = self._free.pop()
+            self._indx[handle] = user_data
+        else:
+            handle = len(self._indx)
+            self._indx.append(user_data)
+            self._bounds.append(None)
+            for axis in range(2):
+                self._where[axis].extend((0, 0))
+
+        # start both endpoints past everything, then sort them down into place
+        self._bounds[handle] = [math.inf, math.inf, math.inf, math.inf]
+        for axis in range(2):
+            for is_max in range(2):
+                self._where[axis][2 * handle + is_max] = len(self._values[axis])
+                self._values[axis].append(math.inf)
+                self._owners[axis].append(handle)
+                self._is_max[axis].append(is_max)
+        self.move_proxy(handle, aabb)
+        return handle
+
+    def destroy_proxy(self, handle: int):
+        # sort both endpoints out past everything (ending every overlap) and drop them
+        self.set_bounds(handle, math.inf, math.inf, math.inf, math.inf)
+        for axis in range(2):
+            for _ in range(2):
+                self._values[axis].pop()
+                self._owners[axis].pop()
+                self._is_max[axis].pop()
+        self._indx[handle] = -1
+        self._free.append(handle)
+
+    def get_indx(self, handle: int) -> int:
+        return self._indx[handle]
+
+    def get_fat_aabb(self, handle: int) -> AABB:
+        return AABB(*self._bounds[handle])
+
+    def move_proxy(self, handle: int, new_aabb: AABB, displacement: Vector2 = None) -> bool:
+        '''moves the proxy's endpoints to new_aabb. returns True if any endpoint changed
+        places with another one. displacement is ignored, there is no fattening'''
+        swaps = self._swaps
+        self.set_bounds(handle, new_aabb._min_x, new_aabb._min_y, new_aabb._max_x, new_aabb._max_y)
+        return self._swaps != swaps
+
+    def set_bounds(self, handle: int, min_x: float, min_y: float, max_x: float, max_y: float):
+        old = self._bounds[handle]
+        self._bounds[handle] = [min_x, min_y, max_x, max_y]
+        for axis in range(2):
+            # moving down: min leads so the interval never turns inside out, moving up: max leads
+            if self._bounds[handle][axis] < old[axis]:
+                order = (0, 1)
+            else:
+                order = (1, 0)
+            for is_max in order:
+                position = self._where[axis][2 * handle + is_max]
+                self._values[axis][position] = self._bounds[handle][axis + 2 * is_max]
+                self.sort_down(axis, position)
+                self.sort_up(axis, self._where[axis][2 * handle + is_max])
+
+    def sort_down(self, axis: int, position: int):
+        values = self._values[axis]
+        owners = self._owners[axis]
+        is_max = self._is_max[axis]
+        where = self._where[axis]
+        value = values[position]
+        handle = owners[position]
+        endpoint_max = is_max[position]
+
+        while position > 0 and (values[position - 1], is_max[position - 1]) > (value, endpoint_max):
+            other = owners[position - 1]
+            other_max = is_max[position - 1]
+            if other != handle and endpoint_max != other_max:
+                self._swaps += 1
+                if endpoint_max:
+                    # our max dropped below their min
+                    self._pairs.discard((min(handle, other), max(handle, other)))
+                elif self.overlaps(handle, other):
+                    # our min dropped below their max
+                    self._pairs.add((min(handle, other), max(handle, other)))
+
+            values[position] = values[position - 1]
+            owners[position] = other
+            is_max[position] = other_max
+            where[2 * other + other_max] = position
+            position -= 1
+
+        values[position] = value
+        owners[position] = handle
+        is_max[position] = endpoint_max
+        where[2 * handle + endpoint_max] = position
+
+    def sort_up(self, axis: int, position: int):
+        values = self._values[axis]
+        owners = self._owners[axis]
+        is_max = self._is_max[axis]
+        where = self._where[axis]
+        value = values[position]
+        handle = owners[position]
+        endpoint_max = is_max[position]
+
+        last = len(values) - 1
+        while position < last and (values[position + 1], is_max[position + 1]) < (value, endpoint_max):
+            other = owners[position + 1]
+            other_max = is_max[position + 1]
+            if other != handle and endpoint_max != other_max:
+                self._swaps += 1
+                if not endpoint_max:
+                    # our min rose above their max
+                    self._pairs.discard((min(handle, other), max(handle, other)))
+                elif self.overlaps(handle, other):
+                    # our max rose above their min
+                    self._pairs.add((min(handle, other), max(handle, other)))
+
+            values[position] = values[position + 1]
+            owners[position] = other
+            is_max[position] = other_max
+            where[2 * other + other_max] = position
+            position += 1
+
+        values[position] = value
+        owners[position] = handle
+        is_max[position] = endpoint_max
+        where[2 * handle + endpoint_max] = position
+
+    def overlaps(self, a: int, b: int) -> bool:
+        a_min_x, a_min_y, a_max_x, a_max_y = self._bounds[a]
+        b_min_x, b_min_y, b_max_x, b_max_y = self._bounds[b]
+        return not (a_max_x < b_min_x or a_min_x > b_max_x or a_max_y < b_min_y or a_min_y > b_max_y)
+
+    def query(self, aabb: AABB):
+        '''yields the indx of every proxy whose box overlaps aabb. walks the x endpoints up to
+        aabb's max x, so this is O(N), the pair set is what this structure is for'''
+        values = self._values[0]
+        owners = self._owners[0]
+        is_max = self._is_max[0]
+        self._num_checks = 0
+        for position in range(len(values)):
+            if values[position] > aabb._max_x:
+                break
+            if is_max[position]:
+                continue
+            self._num_checks += 1
+            min_x, min_y, max_x, max_y = self._bounds[owners[position]]
+            if max_x >= aabb._min_x and min_y <= aabb._max_y and max_y >= aabb._min_y:
+                yield self._indx[owners[position]]
+
+    def query_all_pairs(self):
+        '''yields (indx, indx) for every overlapping pair, straight from the maintained set'''
+        self._num_checks = self._swaps + len(self._pairs)
+        self._swaps = 0
+        for a, b in self._pairs:
+            yield (self._indx[a], self._indx[b])
+
+    def render_tree(self, screen, color):
+        for handle, bounds in enumerate(self._bounds):
+            if self._indx[handle] < 0:
+                continue
+            min_x, min_y, max_x, max_y = bounds
+            pygame.draw.rect(screen, pygame.Color(0, 255, 0), Rect(min_x, min_y, max_x - min_x, max_y - min_y), 1)
@@ -3,6 +3,10 @@ from pygame import draw
 from pygame import Rect
 from pygame import math
 from pygame.sprite import Sprite
+from typing import List, Tuple
+
+# how far a wall's broadphase box reaches past the screen, far enough that no step can clear it
+WALL_REACH = 1e9
 
 class Wall(Sprite):
     _pos: Vector2
@@ -42,5 +46,26 @@ class Wall(Sprite):
         norm_acc = ref._acc - self._acc
         self._acc = self._acc.reflect(norm_acc)
         
+    def half_space_bounds(self, reach: float = WALL_REACH) -> Tuple[float, float, float, float]:
+        '''(min x, min y, max x, max y) for the broadphase: the wall treated as the half space
+        behind its inner face, so a circle that moved far past it still overlaps it'''
+        min_x, min_y, max_x, max_y = -reach, -reach, reach, reach
+        if self._norm_vect.x > 0:
+            max_x = self.rect.right
+        elif self._norm_vect.x < 0:
+            min_x = self.rect.left
+        if self._norm_vect.y > 0:
+            max_y = self.rect.bottom
+        elif self._norm_vect.y < 0:
+            min_y = self.rect.top
+        return min_x, min_y, max_x, max_y
+
     def render(self, surface):
-        draw.rect(surface, "red", self.rect, 1)
\ No newline at end of file
+        draw.rect(surface, "red", self.rect, 1)
+
+def boundary_walls(screen_width: int, screen_height: int, thickness: int = 50) -> List[Wall]:
+    '''four walls just outside the screen, inner faces on 0 and screen_size - 1, normals pointing in'''
+    return [Wall((-thickness / 2, screen_height / 2), (0, 0), (0, 0), thickness, screen_height + 2 * thickness, (1, 0)),                    # left
+            Wall((screen_width / 2, -thickness / 2), (0, 0), (0, 0), screen_width + 2 * thickness, thickness, (0, 1)),                      # top
+            Wall((screen_width - 1 + thickness / 2, screen_height / 2), (0, 0), (0, 0), thickness, screen_height + 2 * thickness, (-1, 0)), # right
+            Wall((screen_width / 2, screen_height - 1 + thickness / 2), (0, 0), (0, 0), screen_width + 2 * thickness, thickness, (0, -1))]  # bottom